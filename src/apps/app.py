@@ -4,16 +4,18 @@ import sys
 ROOT_DIR = os.path.dirname(os.path.abspath(".."))
 sys.path.insert(0, os.path.abspath(ROOT_DIR))
 
+from functools import lru_cache
 from pathlib import Path
 import base64
 
-import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-
+from src.data.datasets import load_dataset
 from src.visualization.vis import query_prod_growth
 
+# streamlit and plotly are imported inside the functions that use them so that
+# importing this module (tests, load tests, benchmarks) doesn't pay for them.
+APP_DIR = Path(__file__).resolve().parent
+
+
 def img_to_bytes(img_path):
     img_bytes = Path(img_path).read_bytes()
     encoded = base64.b64encode(img_bytes).decode()
@@ -23,12 +25,10 @@ def img_to_bytes(img_path):
 # favicon = """<img src='data:image/png;base64,{}' class='img-fluid'></p>
 #             """.format(img_to_bytes("logo3.png"))
 
-st.beta_set_page_config(
-    layout="centered", page_title="Neuralcraft Labs", page_icon=":smiley:"
-)
-
 
 def _max_width_():
+    import streamlit as st
+
     max_width_str = f"max-width: 950px;"
     st.markdown(
         f"""
@@ -42,32 +42,17 @@ def _max_width_():
     )
 
 
-_max_width_()
-
-
-@st.cache
-def load_prod_growth_data():
-    df = pd.read_csv(ROOT_DIR + "/data/processed/productivity_growth.csv")
-    return df
-
+# datasets are loaded on first use and cached by file fingerprint
+# (see src.data.datasets.load_dataset).
+DATASET_NAMES = ["Productivity Growth", "GDP Per Capita"]
 
-@st.cache
-def load_gdp_data():
-    df = pd.read_csv(ROOT_DIR + "/data/processed/gdp_per_capita.csv")
-    return df
-
-
-# load dataframes and name them
-df_prod = load_prod_growth_data()
-df_gdp = load_gdp_data()
-df_prod.name = "Productivity Growth"
-df_gdp.name = "GDP Per Capita"
-datasets = {df_prod.name: df_prod, df_gdp.name: df_gdp}
 
 # lineplots and scatterplots
 def prod_growth_plot(
     df, countries, subject, color="Country", activity=None, trendline=None
 ):
+    import plotly.express as px
+
     user_query = query_prod_growth(countries=countries, subject=subject)
     name = df.name
     df = df.query(user_query)
@@ -120,6 +105,7 @@ def prod_growth_plot(
     return fig
 
 
+@lru_cache(maxsize=4)
 def render_svg(svg_file):
 
     with open(svg_file, "r") as f:
@@ -131,15 +117,6 @@ def render_svg(svg_file):
         return html
 
 
-logo_html = render_svg("logo3.svg")
-
-st.title("How The Looming Education Crisis Will Reshape Our World.")
-st.markdown("---")
-st.sidebar.markdown(logo_html, unsafe_allow_html=True)
-st.sidebar.markdown("---")
-st.sidebar.markdown("### Menu")
-
-
 def format_trendlines(x):
     if x == "ols":
         return "OLS Linear Regression"
@@ -147,10 +124,10 @@ def format_trendlines(x):
         return "LOWESS"
 
 
-# plotly chart + streamlit sidebar widgets
-# TO DO: give user option to display data dictionary
-def prod_landing_app(dataset):
-    df = datasets[dataset]
+def landing_options(dataset):
+    """Returns the landing page's data and its sidebar options (countries, y-axis
+    measures, trendlines). Runs on every rerun."""
+    df = load_dataset(dataset)
     df.name = dataset
     name = df.name
 
@@ -163,6 +140,15 @@ def prod_landing_app(dataset):
     measures.insert(0, measures[3])
     measures.pop(4)
     trendlines = [None, "ols", "lowess"]
+    return df, countries, measures, trendlines
+
+
+# plotly chart + streamlit sidebar widgets
+# TO DO: give user option to display data dictionary
+def prod_landing_app(dataset):
+    import streamlit as st
+
+    df, countries, measures, trendlines = landing_options(dataset)
 
     country_options = st.sidebar.multiselect(
         "Select Countries", countries, default=["G7"]
@@ -190,5 +176,26 @@ def prod_landing_app(dataset):
             st.error("You don't have a country selected, silly!")
 
 
-dataset_options = st.sidebar.selectbox("Select Dataset", list(datasets.keys()))
-prod_landing_app(dataset_options)
+def main():
+    import streamlit as st
+
+    st.beta_set_page_config(
+        layout="centered", page_title="Neuralcraft Labs", page_icon=":smiley:"
+    )
+    _max_width_()
+
+    logo_html = render_svg(str(APP_DIR / "logo3.svg"))
+
+    st.title("How The Looming Education Crisis Will Reshape Our World.")
+    st.markdown("---")
+    st.sidebar.markdown(logo_html, unsafe_allow_html=True)
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### Menu")
+
+    dataset_options = st.sidebar.selectbox("Select Dataset", DATASET_NAMES)
+    prod_landing_app(dataset_options)
+
+
+# streamlit runs the script as __main__ on every rerun.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+import statistics
+import subprocess
+
+# modules imported on every app rerun or test import.
+MODULES = [
+    "src.visualization.vis",
+    "src.data.datasets",
+    "src.data.olap",
+    "src.apps.app",
+]
+
+_IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+_LOAD_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+from src.data.datasets import load_dataset
+start = time.perf_counter()
+load_dataset({name!r})
+cold = time.perf_counter() - start
+start = time.perf_counter()
+load_dataset({name!r})
+print(cold, time.perf_counter() - start)
+"""
+
+
+def _run(snippet):
+    output = subprocess.run(
+        [sys.executable, "-c", snippet], capture_output=True, text=True, check=True
+    ).stdout
+    return [float(i) for i in output.split()]
+
+
+def bench_imports(modules=MODULES, repeat=5):
+    """Times a cold import of each module in a fresh interpreter.
+
+    Returns
+    --------
+    dict[str, float]
+        Median import time in milliseconds per module.
+    """
+    results = {}
+    for module in modules:
+        timings = [
+            _run(_IMPORT_SNIPPET.format(root=ROOT_DIR, module=module))[0]
+            for _ in range(repeat)
+        ]
+        results[module] = statistics.median(timings) * 1000
+    return results
+
+
+def bench_first_load(names=("Productivity Growth", "GDP Per Capita"), repeat=3):
+    """Times the first (cold) and second (cached) load of each dataset.
+
+    Returns
+    --------
+    dict[str, tuple[float, float]]
+        Median (cold, warm) load times in milliseconds per dataset.
+    """
+    results = {}
+    for name in names:
+        timings = [_run(_LOAD_SNIPPET.format(root=ROOT_DIR, name=name)) for _ in range(repeat)]
+        results[name] = tuple(statistics.median(i) * 1000 for i in zip(*timings))
+    return results
+
+
+if __name__ == "__main__":
+    print("Cold import (median ms)")
+    for module, ms in bench_imports().items():
+        print("  {:<28} {:>8.1f}".format(module, ms))
+
+    print("Dataset load (median ms, cold / cached)")
+    for name, (cold, warm) in bench_first_load().items():
+        print("  {:<28} {:>8.1f} / {:.3f}".format(name, cold, warm))
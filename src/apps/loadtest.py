@@ -0,0 +1,261 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import random
+import resource
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+from src.apps.app import DATASET_NAMES, landing_options, prod_growth_plot
+from src.visualization.vis import query_prod_growth
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def rerun(selection, plot=True):
+    """Does the work of one dashboard rerun for a sidebar selection, without the
+    streamlit widgets: loads the dataset, builds the sidebar options, then builds
+    the plotly figure (plot=True) or only runs its query (plot=False)."""
+    df, _, _, _ = landing_options(selection["dataset"])
+    if plot is True:
+        return prod_growth_plot(
+            df,
+            countries=selection["countries"],
+            subject=selection["subject"],
+            trendline=selection["trendline"],
+        )
+    return df.query(
+        query_prod_growth(
+            countries=selection["countries"], subject=selection["subject"]
+        )
+    )
+
+
+def selection_sequence(options, steps, rng, trendlines=(None,)):
+    """Yields the sidebar selections of a simulated session.
+
+    A session starts on a random dataset with the app's default (G7) and then,
+    like a user exploring, mostly adds countries, sometimes removes one, changes the
+    y-axis measure or the trendline, and now and then switches dataset.
+
+    Parameters
+    -----------
+    options: dict[str, tuple[list, list]]
+        (countries, measures) per dataset, as built by the app's sidebar.
+
+    steps: int
+        Number of selections (reruns).
+
+    rng: random.Random
+
+    trendlines: list
+        Trendlines the session may pick.
+    """
+
+    def start(dataset):
+        countries, measures = options[dataset]
+        default = ["G7"] if "G7" in countries else [countries[0]]
+        return {
+            "dataset": dataset,
+            "countries": default,
+            "subject": measures[0],
+            "trendline": None,
+        }
+
+    selection = start(rng.choice(list(options)))
+    for _ in range(steps):
+        yield dict(selection)
+        countries, measures = options[selection["dataset"]]
+        action = rng.random()
+        if action < 0.5:
+            selection["countries"] = selection["countries"] + [rng.choice(countries)]
+        elif action < 0.65 and len(selection["countries"]) > 1:
+            selection["countries"] = selection["countries"][1:]
+        elif action < 0.85:
+            selection["subject"] = rng.choice(measures)
+        elif action < 0.95:
+            selection["trendline"] = rng.choice(list(trendlines))
+        else:
+            selection = start(rng.choice(list(options)))
+
+
+def _session(selections, plot, think):
+    latencies, errors = [], 0
+    for selection in selections:
+        start = time.perf_counter()
+        try:
+            rerun(selection, plot=plot)
+        except Exception:
+            # counted rather than raised: the app shows a message for some (no
+            # data, no country) and fails on others (e.g. quotes in a country name).
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+        if think > 0:
+            time.sleep(think)
+    return latencies, errors
+
+
+def load_test(sessions=50, concurrency=8, steps=20, plot=None, think=0.0, seed=0):
+    """Runs simulated dashboard sessions concurrently and measures every rerun.
+
+    Parameters
+    -----------
+    sessions: int
+        Number of simulated user sessions.
+
+    concurrency: int
+        Sessions running at the same time (threads, like streamlit's script
+        threads).
+
+    steps: int
+        Reruns (sidebar changes) per session.
+
+    plot: bool (optional)
+        Build the plotly figures. Defaults to True when plotly is installed.
+        Trendlines are only selected when statsmodels is installed too.
+
+    think: float
+        Seconds a session waits between reruns.
+
+    seed: int
+        Seed of the selection sequences.
+
+    Returns
+    --------
+    dict
+        sessions, reruns, errors, p50_ms, p95_ms, p99_ms, throughput (reruns/s),
+        wall_s, session_peak_mb (peak traced allocations of one session run alone)
+        and max_rss_mb (process peak resident memory).
+    """
+    if plot is None:
+        plot = _installed("plotly")
+    trendlines = [None]
+    if plot is True and _installed("statsmodels"):
+        trendlines = [None, "ols", "lowess"]
+
+    # warm-up: first loads are cached and don't count as rerun latency.
+    options = {}
+    for name in DATASET_NAMES:
+        _, countries, measures, _ = landing_options(name)
+        options[name] = (countries, measures)
+
+    rng = random.Random(seed)
+    plans = [
+        list(
+            selection_sequence(options, steps, random.Random(rng.random()), trendlines)
+        )
+        for _ in range(sessions)
+    ]
+
+    # memory of one session on its own, so concurrent sessions don't blur it.
+    tracemalloc.start()
+    _session(plans[0], plot, 0.0)
+    session_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda p: _session(p, plot, think), plans))
+    wall = time.perf_counter() - start
+
+    latencies = np.concatenate([i[0] for i in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    # ru_maxrss is in KB on linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "plot": plot,
+        "reruns": len(latencies),
+        "errors": sum(i[1] for i in results),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "throughput": len(latencies) / wall,
+        "wall_s": wall,
+        "session_peak_mb": session_peak / 2**20,
+        "max_rss_mb": rss_mb,
+    }
+
+
+def check(
+    result,
+    max_p95_ms=None,
+    max_p99_ms=None,
+    min_throughput=None,
+    max_session_mb=None,
+    max_errors=None,
+):
+    """Returns the regression thresholds a load test result fails (empty if none)."""
+    failures = []
+    if max_errors is not None and result["errors"] > max_errors:
+        failures.append("{} failed reruns > {}".format(result["errors"], max_errors))
+    if max_p95_ms is not None and result["p95_ms"] > max_p95_ms:
+        failures.append("p95 {:.1f} ms > {} ms".format(result["p95_ms"], max_p95_ms))
+    if max_p99_ms is not None and result["p99_ms"] > max_p99_ms:
+        failures.append("p99 {:.1f} ms > {} ms".format(result["p99_ms"], max_p99_ms))
+    if min_throughput is not None and result["throughput"] < min_throughput:
+        failures.append(
+            "throughput {:.1f}/s < {}/s".format(result["throughput"], min_throughput)
+        )
+    if max_session_mb is not None and result["session_peak_mb"] > max_session_mb:
+        failures.append(
+            "session memory {:.1f} MB > {} MB".format(
+                result["session_peak_mb"], max_session_mb
+            )
+        )
+    return failures
+
+
+@click.command()
+@click.option("--sessions", default=50, help="Simulated user sessions.")
+@click.option("--concurrency", default=8, help="Sessions running at once.")
+@click.option("--steps", default=20, help="Sidebar changes (reruns) per session.")
+@click.option("--plot/--no-plot", default=None, help="Build plotly figures.")
+@click.option("--think", default=0.0, help="Seconds between a session's reruns.")
+@click.option("--seed", default=0)
+@click.option("--max-p95-ms", type=float, help="Fail if p95 latency is higher.")
+@click.option("--max-p99-ms", type=float, help="Fail if p99 latency is higher.")
+@click.option("--min-throughput", type=float, help="Fail if reruns/s is lower.")
+@click.option("--max-session-mb", type=float, help="Fail if session memory is higher.")
+@click.option("--max-errors", type=int, help="Fail if more reruns fail.")
+def main(
+    sessions,
+    concurrency,
+    steps,
+    plot,
+    think,
+    seed,
+    max_p95_ms,
+    max_p99_ms,
+    min_throughput,
+    max_session_mb,
+    max_errors,
+):
+    """Load-tests the dashboard's rerun path with concurrent simulated sessions.
+    Exits with status 1 when a threshold is exceeded."""
+    result = load_test(sessions, concurrency, steps, plot, think, seed)
+    for k, v in result.items():
+        print("  {:<16} {}".format(k, round(v, 3) if isinstance(v, float) else v))
+
+    failures = check(
+        result, max_p95_ms, max_p99_ms, min_throughput, max_session_mb, max_errors
+    )
+    for failure in failures:
+        print("FAILED: {}".format(failure))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+import pandas as pd
+import numpy as np
+
+
+AGGREGATIONS = ("sum", "mean", "count", "min", "max")
+
+
+def _dense_reduce(data, axis, agg):
+    # nan-aware reductions where all-missing cells stay missing. reducing the last
+    # axis gives a 0-d array rather than a numpy scalar.
+    present = ~np.isnan(data)
+    count = np.asarray(present.sum(axis=axis))
+    if agg == "min":
+        return np.asarray(np.fmin.reduce(data, axis=axis))
+    if agg == "max":
+        return np.asarray(np.fmax.reduce(data, axis=axis))
+
+    if agg == "count":
+        result = count.astype(float)
+    else:
+        total = np.where(present, data, 0.0).sum(axis=axis)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.array(total / count if agg == "mean" else total, dtype=float)
+    result[count == 0] = np.nan
+    return result
+
+
+def _segment_reduce(inverse, n, values, agg):
+    # reduces values sharing the same inverse code (see np.unique).
+    count = np.bincount(inverse, minlength=n)
+    if agg == "count":
+        return count.astype(float)
+    if agg in ("min", "max"):
+        out = np.full(n, np.inf if agg == "min" else -np.inf)
+        ufunc = np.minimum if agg == "min" else np.maximum
+        ufunc.at(out, inverse, values)
+        return out
+
+    total = np.bincount(inverse, weights=values, minlength=n)
+    return total / count if agg == "mean" else total
+
+
+class ArrayCube(object):
+    """N-dimensional array representation of a long-format cube.
+
+    Measures are stored either in a dense NumPy array (missing cells are NaN) or,
+    when few cells are filled, in coordinate (COO) format: an (ndim, nnz) array of
+    integer coordinates plus an (nnz,) array of values. Each axis keeps a sorted
+    pandas Index of its labels so label lookups are vectorized.
+
+    slice, dice and rollup are integer indexing and axis reductions, so on a dense
+    cube they cost O(result) rather than a filter over every row. drill_down undoes
+    a rollup by replaying the cube's other operations on the cube it came from.
+
+    Example
+    --------
+    cube = Tesseract(df).to_array_cube(["Country", "Subject", "Measure", "Year"])
+    g7 = cube.slice("Country", "G7").dice({"Year": range(2000, 2010)})
+    g7_totals = g7.rollup("Year")
+    g7_by_year = g7_totals.drill_down("Year")
+    """
+
+    def __init__(
+        self, axes, labels, data=None, coords=None, values=None, measure="Value"
+    ):
+        """
+        Parameters
+        -----------
+        axes: list[str]
+            Dimension names, one per array axis.
+
+        labels: list[pandas.Index]
+            Sorted labels for each axis.
+
+        data: numpy.ndarray (optional)
+            Dense array of shape [len(i) for i in labels]. Missing cells are NaN.
+
+        coords: numpy.ndarray (optional)
+            Sparse (ndim, nnz) integer coordinates. Used with values instead of data.
+
+        values: numpy.ndarray (optional)
+            Sparse (nnz,) cell values.
+
+        measure: str
+            Name of the measure column when converting back to a DataFrame.
+        """
+        self.axes = list(axes)
+        self.labels = [pd.Index(i) for i in labels]
+        self.measure = measure
+        self.data = data
+        self.coords = coords
+        self.values = values
+        self.format = "dense" if data is not None else "coo"
+
+        # lineage used by drill_down.
+        self._base = None
+        self._ops = []
+
+    @classmethod
+    def from_frame(
+        cls, df, dims, measure="Value", agg="sum", format=None, dense_threshold=0.25
+    ):
+        """Builds an ArrayCube from a long-format DataFrame.
+
+        Parameters
+        -----------
+        df: pandas DataFrame
+
+        dims: list[str]
+            Columns to use as the cube's axes. Order matters!
+
+        measure: str
+            Numeric column holding the cell values.
+
+        agg: str
+            How rows falling in the same cell are combined: 'sum', 'mean', 'count',
+            'min' or 'max'.
+
+        format: str (optional)
+            'dense' or 'coo'. Picked from the fill ratio when not given.
+
+        dense_threshold: float
+            Minimum fill ratio (filled cells / total cells) for a dense array.
+
+        Returns
+        --------
+        ArrayCube
+        """
+        missing = [i for i in dims + [measure] if i not in df.columns]
+        if len(missing) > 0:
+            raise KeyError(
+                "{} are/is invalid field name(s).".format(missing),
+                "Please choose fields from the following options: {}".format(
+                    df.columns.tolist()
+                ),
+            )
+        if agg not in AGGREGATIONS:
+            raise ValueError(
+                "{} is not a valid aggregation. Choose from {}.".format(
+                    agg, AGGREGATIONS
+                )
+            )
+
+        df = df[df[measure].notna()]
+        codes, labels = [], []
+        for dim in dims:
+            dim_codes, uniques = pd.factorize(df[dim], sort=True)
+            codes.append(dim_codes)
+            labels.append(pd.Index(uniques, name=dim))
+
+        # rows with a missing label can't be placed on an axis.
+        keep = np.all(np.stack(codes) >= 0, axis=0)
+        codes = [i[keep] for i in codes]
+        shape = tuple(len(i) for i in labels)
+
+        flat = np.ravel_multi_index(codes, shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        cell_values = _segment_reduce(
+            inverse, len(cells), df[measure].to_numpy(dtype=float)[keep], agg
+        )
+
+        fill_ratio = len(cells) / max(int(np.prod(shape)), 1)
+        if format is None:
+            format = "dense" if fill_ratio >= dense_threshold else "coo"
+
+        if format == "dense":
+            data = np.full(shape, np.nan)
+            data.flat[cells] = cell_values
+            return cls(dims, labels, data=data, measure=measure)
+        if format == "coo":
+            coords = np.stack(np.unravel_index(cells, shape))
+            return cls(dims, labels, coords=coords, values=cell_values, measure=measure)
+        raise ValueError("format must be 'dense' or 'coo', got {}.".format(format))
+
+    @property
+    def shape(self):
+        return tuple(len(i) for i in self.labels)
+
+    @property
+    def nnz(self):
+        if self.format == "dense":
+            return int(np.count_nonzero(~np.isnan(self.data)))
+        return len(self.values)
+
+    @property
+    def fill_ratio(self):
+        return self.nnz / max(int(np.prod(self.shape)), 1)
+
+    def _axis(self, axis):
+        try:
+            return self.axes.index(axis)
+        except ValueError:
+            raise KeyError(
+                "{} is not an axis of this cube.".format(axis),
+                "Please choose from the following options: {}".format(self.axes),
+            )
+
+    def _positions(self, axis, labels):
+        positions = self.labels[axis].get_indexer(labels)
+        if np.any(positions < 0):
+            missing = [l for l, i in zip(labels, positions) if i < 0]
+            raise KeyError("{} not found on axis {}.".format(missing, self.axes[axis]))
+        return positions
+
+    def _new(self, axes, labels, data=None, coords=None, values=None):
+        return ArrayCube(
+            axes, labels, data=data, coords=coords, values=values, measure=self.measure
+        )
+
+    def _apply(self, op):
+        kind, axis_name, arg = op
+        axis = self._axis(axis_name)
+        axes = self.axes[:axis] + self.axes[axis + 1 :]
+        labels = self.labels[:axis] + self.labels[axis + 1 :]
+
+        if kind == "slice":
+            i = self._positions(axis, [arg])[0]
+            if self.format == "dense":
+                return self._new(
+                    axes, labels, data=np.asarray(self.data.take(i, axis=axis))
+                )
+            keep = self.coords[axis] == i
+            coords = np.delete(self.coords[:, keep], axis, axis=0)
+            return self._new(axes, labels, coords=coords, values=self.values[keep])
+
+        if kind == "dice":
+            positions = self._positions(axis, arg)
+            labels = list(self.labels)
+            labels[axis] = self.labels[axis][positions]
+            if self.format == "dense":
+                return self._new(
+                    self.axes, labels, data=self.data.take(positions, axis=axis)
+                )
+            # maps old positions on the axis to new ones (-1 if dropped).
+            remap = np.full(len(self.labels[axis]), -1)
+            remap[positions] = np.arange(len(positions))
+            new_axis = remap[self.coords[axis]]
+            keep = new_axis >= 0
+            coords = self.coords[:, keep].copy()
+            coords[axis] = new_axis[keep]
+            return self._new(self.axes, labels, coords=coords, values=self.values[keep])
+
+        if kind == "rollup":
+            if self.format == "dense":
+                return self._new(axes, labels, data=_dense_reduce(self.data, axis, arg))
+            coords = np.delete(self.coords, axis, axis=0)
+            shape = tuple(len(i) for i in labels)
+            if len(shape) == 0:
+                # the grand total: a single cell, if any value is left.
+                n = int(len(self.values) > 0)
+                values = _segment_reduce(
+                    np.zeros(len(self.values), dtype=np.int64), n, self.values, arg
+                )
+                return self._new(axes, labels, coords=coords[:, :n], values=values)
+            flat = np.ravel_multi_index(coords, shape)
+            cells, inverse = np.unique(flat, return_inverse=True)
+            values = _segment_reduce(inverse, len(cells), self.values, arg)
+            coords = np.stack(np.unravel_index(cells, shape))
+            return self._new(axes, labels, coords=coords, values=values)
+
+        raise ValueError("Unknown cube operation {}.".format(kind))
+
+    def _derive(self, op):
+        cube = self._apply(op)
+        cube._base = self._base if self._base is not None else self
+        cube._ops = self._ops + [op]
+        return cube
+
+    def slice(self, axis, label):
+        """Fixes an axis to a single label and drops it from the cube."""
+        return self._derive(("slice", axis, label))
+
+    def dice(self, selections):
+        """Keeps a subset of labels on one or more axes.
+
+        Parameters
+        -----------
+        selections: dict[str, list]
+            Axis names as keys and the labels to keep as values.
+        """
+        cube = self
+        for axis, labels in selections.items():
+            cube = cube._derive(("dice", axis, list(labels)))
+        return cube
+
+    def rollup(self, axis, agg="sum"):
+        """Aggregates an axis away with 'sum', 'mean', 'count', 'min' or 'max'."""
+        if agg not in AGGREGATIONS:
+            raise ValueError(
+                "{} is not a valid aggregation. Choose from {}.".format(
+                    agg, AGGREGATIONS
+                )
+            )
+        return self._derive(("rollup", axis, agg))
+
+    def drill_down(self, axis):
+        """Restores an axis removed by a previous rollup, keeping every other operation."""
+        rolled = [op for op in self._ops if op[0] == "rollup" and op[1] == axis]
+        if len(rolled) == 0:
+            raise ValueError("{} has not been rolled up.".format(axis))
+
+        cube = self._base
+        for op in self._ops:
+            if op is not rolled[-1]:
+                cube = cube._derive(op)
+        return cube
+
+    def to_dense(self):
+        """Returns the cube's measures as a dense array (missing cells are NaN)."""
+        if self.format == "dense":
+            return self.data
+        data = np.full(self.shape, np.nan)
+        if len(self.axes) == 0:
+            # 0-d: the single cell, if filled.
+            data[...] = self.values[0] if len(self.values) > 0 else np.nan
+            return data
+        data[tuple(self.coords)] = self.values
+        return data
+
+    def to_csr(self):
+        """Returns a 2-D cube as a scipy.sparse CSR matrix (rows are the first axis)."""
+        if len(self.axes) != 2:
+            raise ValueError("to_csr needs a 2-D cube, this one has axes {}.".format(
+                self.axes
+            ))
+        try:
+            from scipy import sparse
+        except ImportError:
+            raise ImportError("to_csr requires scipy. pip install scipy")
+
+        if self.format == "dense":
+            rows, cols = np.nonzero(~np.isnan(self.data))
+            values = self.data[rows, cols]
+        else:
+            (rows, cols), values = self.coords, self.values
+        return sparse.csr_matrix((values, (rows, cols)), shape=self.shape)
+
+    def to_frame(self):
+        """Converts the cube back to a long-format DataFrame, skipping missing cells."""
+        if len(self.axes) == 0:
+            # every axis was sliced or rolled up: one row with the measure, if any.
+            values = self.to_dense().reshape(1)
+            return pd.DataFrame({self.measure: values[~np.isnan(values)]})
+        if self.format == "dense":
+            coords = np.nonzero(~np.isnan(self.data))
+            values = self.data[coords]
+        else:
+            coords, values = tuple(self.coords), self.values
+
+        df = pd.DataFrame(
+            {axis: self.labels[i].take(coords[i]) for i, axis in enumerate(self.axes)}
+        )
+        df[self.measure] = values
+        return df
+
+    def __repr__(self):
+        return "ArrayCube(axes={}, shape={}, format='{}', fill_ratio={:.3f})".format(
+            self.axes, self.shape, self.format, self.fill_ratio
+        )
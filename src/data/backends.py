@@ -0,0 +1,325 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from collections import OrderedDict
+import operator
+import sqlite3
+import threading
+
+import pandas as pd
+import numpy as np
+
+from src.data.fingerprint import frame_fingerprint
+
+
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda s, v: s.isin(v),
+    "not in": lambda s, v: ~s.isin(v),
+}
+
+SQL_OPERATORS = {
+    "==": "=",
+    "!=": "<>",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "in": "IN",
+    "not in": "NOT IN",
+}
+
+
+def _validate_conditions(df, conditions):
+    for field, op, value in conditions:
+        if field not in df.columns:
+            raise KeyError(
+                "{} is an invalid field name.".format(field),
+                "Please choose fields from the following options: {}".format(
+                    df.columns.tolist()
+                ),
+            )
+        if op not in FILTER_OPERATORS:
+            raise ValueError(
+                "{} is not a valid operator. Choose from {}.".format(
+                    op, list(FILTER_OPERATORS)
+                )
+            )
+
+
+class PandasBackend(object):
+    """Default execution backend: pandas groupby and boolean masks."""
+
+    name = "pandas"
+
+    def group(self, df, by_fields, aggregate_by):
+        """Groups and aggregates with 'sum', 'mean', 'median', 'count', 'std', 'min'
+        or 'max'.
+
+        Returns
+        --------
+        pandas.DataFrame
+            Indexed by the by_fields, like DataFrame.groupby(by_fields).<agg>().
+        """
+        grouped = df.groupby(by_fields)
+        if aggregate_by == "sum":
+            return grouped.sum()
+        if aggregate_by == "mean":
+            return grouped.mean()
+        if aggregate_by == "median":
+            return grouped.median()
+        if aggregate_by == "count":
+            return grouped.count()
+        if aggregate_by == "std":
+            return grouped.std()
+        if aggregate_by == "min":
+            return grouped.min()
+        if aggregate_by == "max":
+            return grouped.max()
+        raise ValueError("{} is not a supported aggregation.".format(aggregate_by))
+
+    def rows(self, df, conditions):
+        """Returns the positions of the rows matching every (field, operator, value)
+        condition."""
+        _validate_conditions(df, conditions)
+        mask = np.ones(len(df), dtype=bool)
+        for field, op, value in conditions:
+            mask &= FILTER_OPERATORS[op](df[field], value).to_numpy()
+        return np.flatnonzero(mask)
+
+    def filter(self, df, conditions):
+        """Keeps the rows matching every (field, operator, value) condition."""
+        return df.iloc[self.rows(df, conditions)]
+
+
+class SQLBackend(object):
+    """Runs group/filter specs as SQL on an embedded, in-process engine.
+
+    Aggregations the engine can't reproduce exactly (or non-numeric value columns
+    for anything but 'count') fall back to pandas, so results always match
+    PandasBackend.
+    """
+
+    name = None
+    aggregates = {}
+
+    def __init__(self):
+        self._pandas = PandasBackend()
+
+    def _execute(self, df, sql, params):
+        raise NotImplementedError
+
+    def _quote(self, name):
+        return '"{}"'.format(str(name).replace('"', '""'))
+
+    def supports(self, df, by_fields, aggregate_by):
+        if aggregate_by not in self.aggregates:
+            return False
+        if aggregate_by == "count":
+            return True
+        value_fields = [i for i in df.columns if i not in by_fields]
+        return all(
+            pd.api.types.is_numeric_dtype(df[i])
+            and not pd.api.types.is_bool_dtype(df[i])
+            for i in value_fields
+        )
+
+    def group(self, df, by_fields, aggregate_by):
+        if not self.supports(df, by_fields, aggregate_by):
+            return self._pandas.group(df, by_fields, aggregate_by)
+
+        value_fields = [i for i in df.columns if i not in by_fields]
+        keys = ", ".join(self._quote(i) for i in by_fields)
+        template = self.aggregates[aggregate_by]
+        aggs = ", ".join(
+            "{} AS {}".format(template.format(self._quote(i)), self._quote(i))
+            for i in value_fields
+        )
+        # pandas drops groups with a null key.
+        where = " AND ".join("{} IS NOT NULL".format(self._quote(i)) for i in by_fields)
+        sql = (
+            "SELECT {keys}{sep}{aggs} FROM cube WHERE {where} "
+            "GROUP BY {keys} ORDER BY {keys}"
+        ).format(keys=keys, sep=", " if aggs else "", aggs=aggs, where=where)
+        result = self._execute(df, sql, [])
+
+        # restores the dtypes pandas would return.
+        for field in by_fields:
+            result[field] = result[field].astype(df[field].dtype)
+        for field in value_fields:
+            if aggregate_by == "count":
+                result[field] = result[field].astype("int64")
+            elif aggregate_by in ("sum", "min", "max"):
+                result[field] = result[field].astype(
+                    df[field].dtype
+                    if pd.api.types.is_integer_dtype(df[field])
+                    else "float64"
+                )
+            else:
+                result[field] = result[field].astype("float64")
+        return result.set_index(by_fields)
+
+    def rows(self, df, conditions):
+        _validate_conditions(df, conditions)
+        clauses, params = [], []
+        for field, op, value in conditions:
+            column = self._quote(field)
+            # sql comparisons with NULL are never true, while pandas masks keep
+            # missing values for != and not in, and isin matches missing values.
+            if op in ("in", "not in"):
+                value = list(value)
+                nulls = any(_is_null(i) for i in value)
+                value = [i for i in value if not _is_null(i)]
+                if len(value) == 0:
+                    clause = "1 = 0" if op == "in" else "1 = 1"
+                else:
+                    clause = "{} {} ({})".format(
+                        column, SQL_OPERATORS[op], ", ".join("?" for _ in value)
+                    )
+                if (op == "in") == nulls:
+                    clause = "({} OR {} IS NULL)".format(clause, column)
+                else:
+                    clause = "({} AND {} IS NOT NULL)".format(clause, column)
+                params.extend(value)
+            elif _is_null(value):
+                # comparisons with a missing value are only true for !=.
+                if op == "!=":
+                    continue
+                clause = "1 = 0"
+            elif op == "!=":
+                clause = "({} <> ? OR {} IS NULL)".format(column, column)
+                params.append(value)
+            else:
+                clause = "{} {} ?".format(column, SQL_OPERATORS[op])
+                params.append(value)
+            clauses.append(clause)
+
+        # selects the matching row positions so the result keeps df's dtypes and index.
+        sql = "SELECT _row FROM cube{} ORDER BY _row".format(
+            " WHERE " + " AND ".join(clauses) if clauses else ""
+        )
+        rows = self._execute(
+            df.assign(_row=np.arange(len(df))), sql, _to_python(params)
+        )
+        return rows["_row"].to_numpy()
+
+    def filter(self, df, conditions):
+        return df.iloc[self.rows(df, conditions)]
+
+
+def _is_null(value):
+    return pd.api.types.is_scalar(value) and pd.isna(value)
+
+
+def _to_python(params):
+    # numpy scalars aren't valid sqlite parameters.
+    return [i.item() if isinstance(i, np.generic) else i for i in params]
+
+
+class SQLiteBackend(SQLBackend):
+    """In-process SQLite (standard library). Tables are loaded once per frame
+    fingerprint and kept in an in-memory database."""
+
+    name = "sqlite"
+    aggregates = {
+        "sum": "COALESCE(SUM({0}), 0)",
+        "mean": "AVG({0})",
+        "count": "COUNT({0})",
+        "min": "MIN({0})",
+        "max": "MAX({0})",
+    }
+
+    def __init__(self, max_tables=4):
+        super().__init__()
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        # instances are shared across threads (see get_backend).
+        self._lock = threading.Lock()
+
+    def _connection(self, df):
+        key = frame_fingerprint(df) + repr(df.columns.tolist())
+        conn = self._tables.get(key)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            df.to_sql("cube", conn, index=False)
+            self._tables[key] = conn
+            if len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)[1].close()
+        else:
+            self._tables.move_to_end(key)
+        return conn
+
+    def _execute(self, df, sql, params):
+        with self._lock:
+            return pd.read_sql_query(sql, self._connection(df), params=params)
+
+
+class DuckDBBackend(SQLBackend):
+    """In-process DuckDB (optional dependency). Scans the pandas frame in place."""
+
+    name = "duckdb"
+    aggregates = {
+        "sum": "COALESCE(SUM({0}), 0)",
+        "mean": "AVG({0})",
+        "median": "MEDIAN({0})",
+        "count": "COUNT({0})",
+        "std": "STDDEV_SAMP({0})",
+        "min": "MIN({0})",
+        "max": "MAX({0})",
+    }
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("The duckdb backend requires duckdb. pip install duckdb")
+        self._conn = duckdb.connect()
+
+    def _execute(self, df, sql, params):
+        conn = self._conn.cursor()
+        conn.register("cube", df)
+        try:
+            return conn.execute(sql, params).df()
+        finally:
+            conn.close()
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "sqlite": SQLiteBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+# one instance per backend name, so caches (e.g. sqlite tables) are shared by every
+# Tesseract in the process.
+_INSTANCES = {}
+_INSTANCES_LOCK = threading.Lock()
+
+
+def get_backend(backend=None):
+    """Returns a backend instance from a name ('pandas', 'sqlite', 'duckdb'), an
+    instance (returned as-is) or None (pandas). Names return the same shared
+    instance every time."""
+    if backend is None:
+        backend = "pandas"
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(
+                "{} is not a valid backend. Choose from {}.".format(
+                    backend, list(BACKENDS)
+                )
+            )
+        with _INSTANCES_LOCK:
+            if backend not in _INSTANCES:
+                _INSTANCES[backend] = BACKENDS[backend]()
+            return _INSTANCES[backend]
+    return backend
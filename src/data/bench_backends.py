@@ -0,0 +1,112 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+import statistics
+import time
+
+import pandas as pd
+import numpy as np
+
+from src.data.backends import BACKENDS, get_backend
+from src.data.olap import Tesseract
+
+DATASETS = {
+    "productivity_growth": ROOT_DIR + "/data/processed/productivity_growth.csv",
+    "gdp_per_capita": ROOT_DIR + "/data/processed/gdp_per_capita.csv",
+}
+
+# (name, filter conditions, by_fields, aggregate_by) run against every dataset.
+SPECS = [
+    ("count by Country", [], ["Country"], "count"),
+    ("count by Country/Subject/Measure", [], ["Country", "Subject", "Measure"], "count"),
+    ("sum by Country/Year", [], ["Country", "Year"], "sum"),
+    ("mean by Subject/Year", [], ["Subject", "Year"], "mean"),
+    ("max by Country/Subject", [], ["Country", "Subject"], "max"),
+    ("filter Year >= 2000", [("Year", ">=", 2000)], None, None),
+    ("filter G7/OECD, 1990s", [
+        ("Country", "in", ["G7", "OECD - Total"]),
+        ("Year", ">=", 1990),
+        ("Year", "<", 2000),
+    ], None, None),
+    ("filter not G7, Value != 0", [
+        ("Country", "!=", "G7"),
+        ("Value", "!=", 0),
+    ], None, None),
+    ("filter not G7/OECD", [("Country", "not in", ["G7", "OECD - Total"])], None, None),
+]
+
+
+def with_nulls(df, fraction=0.05, seed=0):
+    """Copy of df with missing Country and Value entries, so the equivalence check
+    covers NULL handling (e.g. != and not in keep missing values in pandas)."""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    for field in ("Country", "Value"):
+        df.loc[rng.random(len(df)) < fraction, field] = None
+    return df
+
+
+def _available_backends():
+    backends = {}
+    for name in BACKENDS:
+        try:
+            backends[name] = get_backend(name)
+        except ImportError:
+            print("Skipping {} (not installed).".format(name))
+    return backends
+
+
+def _run(df, backend, conditions, by_fields, aggregate_by):
+    tess = Tesseract(df, backend=backend)
+    if len(conditions) > 0:
+        tess.filter(conditions)
+    if by_fields is not None:
+        # only numeric value columns so every backend runs the spec natively.
+        tess.df = tess.df[by_fields + ["Value"]]
+        tess.group(by_fields, aggregate_by)
+    return tess.df
+
+
+def bench(repeat=5):
+    """Times every spec on every dataset and installed backend, checking that all
+    backends return identical results.
+
+    Returns
+    --------
+    pandas.DataFrame
+        Median milliseconds per dataset and spec (rows) and backend (columns).
+    """
+    backends = _available_backends()
+    rows = []
+    frames = {}
+    for dataset, path in DATASETS.items():
+        frames[dataset] = pd.read_csv(path)
+        frames[dataset + " (nulls)"] = with_nulls(frames[dataset])
+    for dataset, df in frames.items():
+        for name, conditions, by_fields, aggregate_by in SPECS:
+            row = {"dataset": dataset, "spec": name}
+            expected = None
+            for backend_name, backend in backends.items():
+                # first run warms up per-backend caches (e.g. sqlite table loads).
+                result = _run(df, backend, conditions, by_fields, aggregate_by)
+                if expected is None:
+                    expected = result
+                else:
+                    pd.testing.assert_frame_equal(result, expected)
+
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    _run(df, backend, conditions, by_fields, aggregate_by)
+                    timings.append(time.perf_counter() - start)
+                row[backend_name] = statistics.median(timings) * 1000
+            rows.append(row)
+    return pd.DataFrame(rows).set_index(["dataset", "spec"])
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 120)
+    print("Median ms per query (identical results across backends)")
+    print(bench().round(2))
@@ -0,0 +1,235 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from contextlib import contextmanager
+import hashlib
+import json
+import shutil
+import uuid
+
+import pandas as pd
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # windows: evictions aren't serialized across processes.
+    fcntl = None
+
+from src.data.fingerprint import frame_fingerprint
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data",
+    "interim",
+    "tesseract_cache",
+)
+
+
+def save_frame(df, path):
+    """Writes a DataFrame as a directory of one .npy file per column.
+
+    Numeric, bool and datetime columns are stored as raw arrays that load back
+    memory-mapped. Other columns are dictionary-encoded: integer codes (also
+    memory-mapped) plus their distinct values. A non-default index is stored as
+    columns and restored on load.
+    """
+    os.makedirs(path)
+    index = None
+    if not isinstance(df.index, pd.RangeIndex) or df.index.name is not None:
+        names = list(df.index.names)
+        df = df.reset_index()
+        index = {"columns": list(df.columns[: len(names)]), "names": names}
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        meta = {"name": col, "dtype": str(values.dtype), "file": "{}.npy".format(i)}
+        array = values.to_numpy()
+        if array.dtype.kind in "biufcmM":
+            np.save(os.path.join(path, meta["file"]), array)
+        else:
+            codes, uniques = pd.factorize(values)
+            np.save(os.path.join(path, meta["file"]), codes.astype(np.int32))
+            np.save(
+                os.path.join(path, "{}.values.npy".format(i)),
+                np.asarray(uniques, dtype=object),
+                allow_pickle=True,
+            )
+            meta["encoded"] = True
+        columns.append(meta)
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"columns": columns, "index": index, "rows": len(df)}, f)
+
+
+def load_frame(path, mmap=True):
+    """Reads a DataFrame written by save_frame.
+
+    With mmap=True numeric columns are zero-copy views of the files, mapped
+    copy-on-write: the frame can be modified like any other, pages are copied in
+    memory when first written, and the files never change.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    data = {}
+    for i, col in enumerate(meta["columns"]):
+        array = np.load(
+            os.path.join(path, col["file"]), mmap_mode="c" if mmap else None
+        )
+        if col.get("encoded"):
+            uniques = np.load(
+                os.path.join(path, "{}.values.npy".format(i)), allow_pickle=True
+            )
+            array = pd.Categorical.from_codes(np.asarray(array), uniques)
+            data[col["name"]] = pd.Series(array).astype(col["dtype"])
+        else:
+            # a plain ndarray view still backed by the mapped file.
+            data[col["name"]] = array.view(np.ndarray)
+
+    df = pd.DataFrame(data, copy=False)
+    if meta["index"] is not None:
+        df = df.set_index(meta["index"]["columns"])
+        df.index.names = meta["index"]["names"]
+    return df
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(path, i))
+        for i in os.listdir(path)
+        if os.path.isfile(os.path.join(path, i))
+    )
+
+
+class ResultCache(object):
+    """Persistent, content-addressed on-disk cache for query results.
+
+    Entries are keyed by a digest of the data fingerprint and the normalized query
+    spec, so any process querying the same data with the same spec finds the
+    result. Results are stored column-wise (see save_frame) and loaded back
+    memory-mapped.
+
+    Safe for concurrent use from several processes: entries are written to a
+    temporary directory and renamed into place atomically, readers treat entries
+    disappearing mid-read as misses, and evictions are serialized with a lock file.
+    When the cache grows past max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=512 * 2 ** 20):
+        """
+        Parameters
+        -----------
+        directory: str
+            Cache location. Created if missing.
+
+        max_bytes: int
+            Size bound for all entries together (default 512MB).
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(fingerprint, spec):
+        """Returns the entry key for a data fingerprint and a JSON-serializable spec.
+
+        Raises
+        -------
+        TypeError
+            Raised if the spec isn't JSON-serializable (e.g. contains functions).
+        """
+        normalized = json.dumps(
+            {"data": fingerprint, "spec": spec}, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Returns the cached DataFrame for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            df = load_frame(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        try:
+            # marks the entry as recently used for eviction.
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return df
+
+    def put(self, key, df):
+        """Stores df under key (first writer wins) and evicts entries over max_bytes."""
+        tmp = os.path.join(self.directory, ".tmp-{}".format(uuid.uuid4().hex))
+        save_frame(df, tmp)
+        try:
+            os.rename(tmp, self._path(key))
+        except OSError:
+            # another process stored the same result first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def get_or_compute(self, df, spec, compute):
+        """Returns the cached result of compute() for (df, spec), computing and storing
+        it on a miss."""
+        key = self.key(frame_fingerprint(df), spec)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.directory, ".lock"), "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def size(self):
+        """Total bytes used by the cache entries."""
+        return sum(i[1] for i in self._entries())
+
+    def _evict(self):
+        with self._lock():
+            entries = self._entries()
+            total = sum(i[1] for i in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                # renames first so readers never see a half-deleted entry. mapped
+                # files stay readable until their readers are done.
+                doomed = os.path.join(self.directory, ".del-{}".format(uuid.uuid4().hex))
+                try:
+                    os.rename(path, doomed)
+                except FileNotFoundError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock():
+            for _, _, path in self._entries():
+                shutil.rmtree(path, ignore_errors=True)
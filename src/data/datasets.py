@@ -0,0 +1,55 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from functools import lru_cache
+
+from src.data.fingerprint import file_fingerprint
+
+PROCESSED_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data",
+    "processed",
+)
+
+DATASETS = {
+    "Productivity Growth": os.path.join(PROCESSED_DIR, "productivity_growth.csv"),
+    "GDP Per Capita": os.path.join(PROCESSED_DIR, "gdp_per_capita.csv"),
+}
+
+
+@lru_cache(maxsize=16)
+def _read_csv(fingerprint):
+    import pandas as pd
+
+    return pd.read_csv(fingerprint[0])
+
+
+def load_dataset(name):
+    """Loads a processed dataset on first use and serves it from memory afterwards.
+
+    The cache is keyed by the file's fingerprint (path, size, mtime), so a rerun
+    costs one stat call rather than hashing the whole DataFrame, and a re-processed
+    file is picked up automatically.
+
+    Parameters
+    -----------
+    name: str
+        One of the keys of DATASETS.
+
+    Returns
+    --------
+    df: pandas DataFrame
+        Shared between callers. Treat it as read-only.
+    """
+    try:
+        path = DATASETS[name]
+    except KeyError:
+        raise KeyError(
+            "{} is not a valid dataset.".format(name),
+            "Please choose from the following options: {}".format(list(DATASETS)),
+        )
+    df = _read_csv(file_fingerprint(path))
+    df.name = name
+    return df
@@ -0,0 +1,52 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+
+def file_fingerprint(path):
+    """Returns a cheap fingerprint of a file that changes whenever the file does.
+
+    Uses the absolute path, size and modification time from a single stat call
+    instead of reading and hashing the contents.
+
+    Returns
+    --------
+    tuple
+        (absolute path, size in bytes, modification time in ns)
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def frame_fingerprint(df, columns=None):
+    """Returns a digest of a DataFrame's contents (or a subset of its columns).
+
+    Rows are hashed with pandas' vectorized hash_pandas_object and the hashes are
+    digested in row order, so the fingerprint changes if values, dtypes, column
+    names or row order change. The index is not included.
+
+    Parameters
+    -----------
+    df: pandas DataFrame
+
+    columns: list[str] (optional)
+        Columns to include. Defaults to all columns.
+
+    Returns
+    --------
+    str
+        Hex digest.
+    """
+    import hashlib
+
+    import pandas as pd
+
+    if columns is not None:
+        df = df[list(columns)]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(k), str(v)) for k, v in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,145 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from itertools import combinations
+
+import pandas as pd
+import numpy as np
+
+
+# aggregations whose coarser levels can be derived from a finer level's results.
+DECOMPOSABLE = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+
+def rollup_sets(by_fields):
+    """Returns the grouping sets of ROLLUP(by_fields): every prefix, finest first.
+
+    ['Country', 'Subject'] -> [['Country', 'Subject'], ['Country'], []]
+    """
+    return [list(by_fields[:i]) for i in range(len(by_fields), -1, -1)]
+
+
+def cube_sets(by_fields):
+    """Returns the grouping sets of CUBE(by_fields): every subset, finest first."""
+    return [
+        list(fields)
+        for n in range(len(by_fields), -1, -1)
+        for fields in combinations(by_fields, n)
+    ]
+
+
+def _grouping_id(by_fields, fields):
+    # SQL GROUPING_ID: one bit per by_field, set when the field is aggregated away,
+    # with the first field as the most significant bit.
+    return sum(
+        1 << (len(by_fields) - i - 1)
+        for i, field in enumerate(by_fields)
+        if field not in fields
+    )
+
+
+def _reaggregate(base, fields, aggregate_by):
+    # derives a coarser level from the finest level's aggregates.
+    if aggregate_by == "mean":
+        sums = base.xs("sum", axis=1, level=1)
+        counts = base.xs("count", axis=1, level=1)
+        if len(fields) > 0:
+            sums = sums.groupby(level=fields).sum()
+            counts = counts.groupby(level=fields).sum()
+        else:
+            sums, counts = sums.sum().to_frame().T, counts.sum().to_frame().T
+        return sums / counts
+
+    how = DECOMPOSABLE[aggregate_by]
+    if len(fields) > 0:
+        return base.groupby(level=fields).agg(how)
+    return base.agg(how).to_frame().T
+
+
+def aggregate_grouping_sets(df, by_fields, sets, aggregate_by):
+    """Aggregates several grouping levels (GROUPING SETS) in one pass.
+
+    The by_fields are factorized once and every level groups the integer codes
+    rather than the labels. For 'sum', 'count', 'min', 'max' and 'mean' only the
+    finest level (by_fields) touches the rows; coarser levels are re-aggregated
+    from it. Other aggregations ('median', 'std', callables, dicts) group the
+    pre-factorized codes at each level.
+
+    Parameters
+    -----------
+    df: pandas DataFrame
+
+    by_fields: list[str]
+        Finest grouping. Every grouping set must be a subset of it.
+
+    sets: list[list[str]]
+        Grouping sets, e.g. [['Country', 'Subject'], ['Country'], []].
+
+    aggregate_by: str, dict[str, function], or function
+        See Tesseract.group.
+
+    Returns
+    --------
+    pandas.DataFrame
+        Indexed by by_fields. Fields aggregated away in a level are NaN and the
+        grouping_id column marks each row's level (see _grouping_id).
+    """
+    for fields in sets:
+        invalid = [i for i in fields if i not in by_fields]
+        if len(invalid) > 0:
+            raise KeyError(
+                "{} are/is not in by_fields.".format(invalid),
+                "Grouping sets must be subsets of: {}".format(by_fields),
+            )
+    if isinstance(aggregate_by, str) and aggregate_by.startswith("approx_"):
+        raise ValueError("Grouping sets don't support approximate aggregations.")
+
+    value_fields = [i for i in df.columns if i not in by_fields]
+    uniques = {}
+    frame = {}
+    for field in by_fields:
+        frame[field], uniques[field] = pd.factorize(df[field], sort=True)
+    frame = pd.DataFrame(frame)
+    for field in value_fields:
+        frame[field] = df[field].to_numpy()
+
+    # groupby drops null keys, so rows with a null by_field are dropped everywhere.
+    frame = frame[np.all(frame[by_fields].to_numpy() >= 0, axis=1)]
+
+    derive = isinstance(aggregate_by, str) and (
+        aggregate_by in DECOMPOSABLE or aggregate_by == "mean"
+    )
+    if derive:
+        if aggregate_by == "mean":
+            base = frame.groupby(by_fields)[value_fields].agg(["sum", "count"])
+        else:
+            base = frame.groupby(by_fields)[value_fields].agg(aggregate_by)
+
+    levels = []
+    for fields in sets:
+        if derive and aggregate_by != "mean" and list(fields) == list(by_fields):
+            level = base
+        elif derive:
+            level = _reaggregate(base, list(fields), aggregate_by)
+        elif len(fields) > 0:
+            level = frame.groupby(list(fields))[value_fields].agg(aggregate_by)
+        else:
+            level = frame[value_fields].agg(aggregate_by).to_frame().T
+
+        level = level.reset_index(drop=len(fields) == 0)
+        out = {}
+        for field in by_fields:
+            if field in fields:
+                out[field] = uniques[field].take(level[field].to_numpy())
+            else:
+                out[field] = np.full(len(level), np.nan, dtype=object)
+        out = pd.DataFrame(out)
+        out["grouping_id"] = _grouping_id(by_fields, fields)
+        for field in value_fields:
+            if field in level.columns:
+                out[field] = level[field].to_numpy()
+        levels.append(out)
+
+    return pd.concat(levels, ignore_index=True).set_index(by_fields)
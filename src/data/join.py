@@ -0,0 +1,223 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from collections import OrderedDict
+import weakref
+
+import pandas as pd
+import numpy as np
+
+from src.data.fingerprint import frame_fingerprint
+
+
+JOIN_TYPES = ("inner", "left")
+
+# join indexes keyed by (left fingerprint, right fingerprint, on, how).
+_INDEX_CACHE = OrderedDict()
+_INDEX_CACHE_SIZE = 32
+
+# key column fingerprints per frame object: id -> (weak reference, {on: fingerprint}).
+_FINGERPRINTS = {}
+
+
+def _key_codes(left, right, on):
+    # factorizes the shared dimensions of both frames together into one int code
+    # per row. rows with a null in any key column get -1 and never match.
+    n_left = len(left)
+    codes = np.zeros(n_left + len(right), dtype=np.int64)
+    valid = np.ones(len(codes), dtype=bool)
+    for col in on:
+        col_codes, uniques = pd.factorize(
+            pd.concat([left[col], right[col]], ignore_index=True)
+        )
+        valid &= col_codes >= 0
+        codes = codes * (len(uniques) + 1) + col_codes
+        # re-factorizes so the combined code stays small however many keys there are.
+        codes = pd.factorize(codes)[0]
+    codes[~valid] = -1
+    return codes[:n_left], codes[n_left:]
+
+
+class JoinIndex(object):
+    """Row pairing between two frames on shared dimensions, built once and reused.
+
+    The right frame's keys are sorted once; every left row then finds the run of
+    sorted right rows it matches with a binary search. Those runs are all a join
+    needs: filters on either side are applied to the runs, and (left row, right
+    row) pairs are only expanded for what's left, instead of running a new merge.
+
+    Rows are paired in left order, then right order, like pandas.merge. Unlike
+    pandas.merge, null keys never match.
+    """
+
+    def __init__(self, left, right, on, how="inner"):
+        """
+        Parameters
+        -----------
+        left: pandas DataFrame
+
+        right: pandas DataFrame
+
+        on: list[str]
+            Shared dimensions (columns) to join on.
+
+        how: str
+            'inner' or 'left'.
+        """
+        if how not in JOIN_TYPES:
+            raise ValueError(
+                "{} is not a valid join type. Choose from {}.".format(how, JOIN_TYPES)
+            )
+        for name, df in (("left", left), ("right", right)):
+            missing = [i for i in on if i not in df.columns]
+            if len(missing) > 0:
+                raise KeyError(
+                    "{} are/is invalid field name(s) for the {} frame.".format(
+                        missing, name
+                    ),
+                    "Please choose fields from the following options: {}".format(
+                        df.columns.tolist()
+                    ),
+                )
+
+        self.on = list(on)
+        self.how = how
+
+        left_codes, right_codes = _key_codes(left, right, self.on)
+        right_codes = np.where(right_codes < 0, np.iinfo(np.int64).max, right_codes)
+        right_order = np.argsort(right_codes, kind="stable")
+        sorted_codes = right_codes[right_order]
+
+        # left row i matches right_order[lo[i]:lo[i] + counts[i]].
+        self.right_order = right_order
+        self.lo = np.searchsorted(sorted_codes, left_codes, side="left")
+        hi = np.searchsorted(sorted_codes, left_codes, side="right")
+        self.counts = np.where(left_codes < 0, 0, hi - self.lo)
+        # unfiltered pairs, expanded on first use.
+        self._pairs = None
+
+    def __len__(self):
+        if self.how == "left":
+            return int(np.maximum(self.counts, 1).sum())
+        return int(self.counts.sum())
+
+    def pairs(self, left_mask=None, right_mask=None):
+        """Returns the (left rows, right rows) positions left after filtering.
+
+        Parameters
+        -----------
+        left_mask: numpy.ndarray[bool] (optional)
+            Rows of the left frame to keep.
+
+        right_mask: numpy.ndarray[bool] (optional)
+            Rows of the right frame to keep. For a left join, left rows whose every
+            match is filtered out are kept with no right row, as if the right frame
+            had been filtered before joining.
+        """
+        if left_mask is None and right_mask is None:
+            if self._pairs is None:
+                self._pairs = self._expand(None, None)
+            return self._pairs
+        return self._expand(left_mask, right_mask)
+
+    def _expand(self, left_mask, right_mask):
+        if left_mask is None:
+            left_rows = np.arange(len(self.lo))
+        else:
+            left_rows = np.flatnonzero(left_mask)
+        lo, counts = self.lo[left_rows], self.counts[left_rows]
+        right_order = self.right_order
+
+        if right_mask is not None:
+            # drops filtered right rows from the sorted order and moves every run
+            # onto what's left of it.
+            kept = right_mask[right_order]
+            before = np.r_[0, np.cumsum(kept)]
+            counts = before[lo + counts] - before[lo]
+            lo = before[lo]
+            right_order = right_order[kept]
+
+        if self.how == "left":
+            # unmatched left rows keep one pair with no right row (-1).
+            n_pairs = np.maximum(counts, 1)
+        else:
+            n_pairs = counts
+
+        # pair j of left row i is at sorted position lo[i] + j.
+        starts = np.cumsum(n_pairs) - n_pairs
+        positions = np.arange(n_pairs.sum()) + np.repeat(lo - starts, n_pairs)
+        if self.how == "inner":
+            right_rows = right_order[positions]
+        else:
+            matched = positions < np.repeat(lo + counts, n_pairs)
+            right_rows = np.full(len(positions), -1)
+            right_rows[matched] = right_order[positions[matched]]
+        return np.repeat(left_rows, n_pairs), right_rows
+
+    def apply(self, left, right, left_mask=None, right_mask=None, suffixes=("_x", "_y")):
+        """Materializes the join of the frames the index was built on.
+
+        Returns
+        --------
+        pandas.DataFrame
+            The join keys, the left frame's other columns and the right frame's other
+            columns. Overlapping names get the suffixes.
+        """
+        left_rows, right_rows = self.pairs(left_mask, right_mask)
+
+        right_cols = [i for i in right.columns if i not in self.on]
+        overlap = set(left.columns) & set(right_cols)
+
+        left_part = left.take(left_rows).reset_index(drop=True)
+        left_part.columns = [
+            i + suffixes[0] if i in overlap else i for i in left_part.columns
+        ]
+        right_part = right[right_cols].reset_index(drop=True)
+        if self.how == "inner":
+            right_part = right_part.take(right_rows).reset_index(drop=True)
+        else:
+            right_part = right_part.reindex(right_rows).reset_index(drop=True)
+        right_part.columns = [
+            i + suffixes[1] if i in overlap else i for i in right_part.columns
+        ]
+        return pd.concat([left_part, right_part], axis=1)
+
+
+def _key_fingerprint(df, on):
+    # hashing the key columns costs about as much as a merge, so it's done once per
+    # frame object. the entry goes away with the frame.
+    entry = _FINGERPRINTS.get(id(df))
+    if entry is None or entry[0]() is not df:
+        ref = weakref.ref(df, lambda _, i=id(df): _FINGERPRINTS.pop(i, None))
+        entry = _FINGERPRINTS[id(df)] = (ref, {})
+    if tuple(on) not in entry[1]:
+        entry[1][tuple(on)] = frame_fingerprint(df, on)
+    return entry[1][tuple(on)]
+
+
+def get_join_index(left, right, on, how="inner"):
+    """Returns a cached JoinIndex for the frame pair, building it on first use.
+
+    The cache is keyed by a fingerprint of each frame's key columns, so the index is
+    rebuilt only when the keys (or their row order) change. Fingerprints are
+    computed once per frame object: frames are replaced rather than modified in
+    place (as Tesseract operations do), and a frame whose key columns were
+    overwritten in place needs a copy to be re-indexed.
+    """
+    key = (
+        _key_fingerprint(left, on),
+        _key_fingerprint(right, on),
+        tuple(on),
+        how,
+    )
+    index = _INDEX_CACHE.get(key)
+    if index is None:
+        index = JoinIndex(left, right, on, how=how)
+        _INDEX_CACHE[key] = index
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    else:
+        _INDEX_CACHE.move_to_end(key)
+    return index
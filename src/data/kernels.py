@@ -0,0 +1,202 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from functools import lru_cache
+from typing import Callable
+
+import pandas as pd
+import numpy as np
+
+
+# user-facing aggregation function -> (segmented kernel, extra columns it needs).
+KERNELS = {}
+
+
+def register_kernel(func, kernel, columns=()):
+    """Registers a segmented reduction kernel for a per-group aggregation function.
+
+    When Tesseract.group is given func (alone or in a dict), the rows are sorted by
+    group once and kernel computes every group's result in a single vectorized call
+    instead of calling func once per group.
+
+    Parameters
+    -----------
+    func: function
+        Aggregation function as passed to aggregate_by. Takes a pandas Series.
+
+    kernel: function
+        kernel(values, bounds, **extra) -> numpy.ndarray with one result per group.
+        values are the column's values sorted by group and group i spans
+        values[bounds[i]:bounds[i + 1]]. Must match func's results, NaN handling
+        included.
+
+    columns: list[str]
+        Extra columns the kernel needs (e.g. weights), passed sorted the same way as
+        keyword arguments.
+    """
+    KERNELS[func] = (kernel, tuple(columns))
+    return func
+
+
+def _segment_sum(x, bounds):
+    # np.add.reduceat over non-empty, contiguous segments.
+    if len(bounds) < 2:
+        return np.zeros(0)
+    return np.add.reduceat(x, bounds[:-1])
+
+
+def _divide(num, den):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = num / den
+    return np.where(den == 0, np.nan, result)
+
+
+def geometric_mean(s):
+    """Geometric mean of the non-null values."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.exp(np.log(s).mean())
+
+
+def _geometric_mean_kernel(values, bounds):
+    # like the Series mean above, NaN logs (nulls and negative values) are skipped.
+    with np.errstate(invalid="ignore", divide="ignore"):
+        logs = np.log(values)
+    valid = ~np.isnan(logs)
+    total = _segment_sum(np.where(valid, logs, 0.0), bounds)
+    return np.exp(_divide(total, _segment_sum(valid, bounds)))
+
+
+register_kernel(geometric_mean, _geometric_mean_kernel)
+
+
+@lru_cache(maxsize=None)
+def trimmed_mean(proportion=0.1):
+    """Returns an aggregation function for the mean of the non-null values after
+    cutting int(proportion * n) values off each end."""
+    if not 0 <= proportion < 0.5:
+        raise ValueError("proportion must be in [0, 0.5), got {}.".format(proportion))
+
+    def func(s):
+        values = np.sort(s.dropna().to_numpy())
+        k = int(proportion * len(values))
+        kept = values[k : len(values) - k]
+        return kept.mean() if len(kept) > 0 else np.nan
+
+    def kernel(values, bounds):
+        groups = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+        # sorts by value within each group; NaNs go to the end of their group.
+        values = values[np.lexsort((values, groups))]
+        valid = ~np.isnan(values)
+        counts = _segment_sum(valid, bounds).astype(np.int64)
+        k = (proportion * counts).astype(np.int64)
+
+        cumsum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        starts = bounds[:-1] + k
+        ends = bounds[:-1] + counts - k
+        return _divide(cumsum[ends] - cumsum[starts], ends - starts)
+
+    func.__name__ = "trimmed_mean_{}".format(proportion)
+    return register_kernel(func, kernel)
+
+
+@lru_cache(maxsize=None)
+def weighted_mean(weights):
+    """Returns an aggregation function for the mean weighted by another column.
+
+    The returned function is only meaningful through Tesseract.group's kernel path,
+    which passes the weights; called directly it takes (values, weights).
+    """
+
+    def func(s, w):
+        valid = s.notna() & w.notna()
+        return np.average(s[valid], weights=w[valid]) if valid.any() else np.nan
+
+    def kernel(values, bounds, **extra):
+        w = extra[weights]
+        valid = ~np.isnan(values) & ~np.isnan(w)
+        num = _segment_sum(np.where(valid, values * w, 0.0), bounds)
+        den = _segment_sum(np.where(valid, w, 0.0), bounds)
+        return _divide(num, den)
+
+    func.__name__ = "weighted_mean_{}".format(weights)
+    return register_kernel(func, kernel, columns=[weights])
+
+
+def uses_kernels(aggregate_by):
+    """True if aggregate_by is a callable, or a dict of callables and strs, with at
+    least one registered kernel."""
+    if isinstance(aggregate_by, dict):
+        funcs = list(aggregate_by.values())
+        return all(isinstance(i, (str, Callable)) for i in funcs) and any(
+            i in KERNELS for i in funcs
+        )
+    return isinstance(aggregate_by, Callable) and aggregate_by in KERNELS
+
+
+def segmented_aggregate(df, by_fields, aggregate_by):
+    """Aggregates with registered kernels after sorting the rows by group once.
+
+    Columns whose function has no kernel, or that aren't numeric, fall back to
+    pandas' per-group groupby(...).agg(func). Functions whose kernel needs other
+    columns (e.g. weighted_mean) can't fall back: given alone they only aggregate
+    the numeric columns.
+
+    Raises
+    -------
+    KeyError
+        Raised if a column a kernel needs is not in the DataFrame.
+
+    TypeError
+        Raised if a kernel needing other columns is given a non-numeric column.
+
+    Returns
+    --------
+    pandas.DataFrame
+        Same layout as df.groupby(by_fields).agg(aggregate_by).
+    """
+    if isinstance(aggregate_by, dict):
+        funcs = aggregate_by
+    else:
+        funcs = {i: aggregate_by for i in df.columns if i not in by_fields}
+        if len(KERNELS.get(aggregate_by, (None, ()))[1]) > 0:
+            funcs = {
+                i: f for i, f in funcs.items() if pd.api.types.is_numeric_dtype(df[i])
+            }
+
+    needed = {i for f in funcs.values() for i in KERNELS.get(f, (None, ()))[1]}
+    invalid = [i for i in needed if i not in df.columns]
+    if len(invalid) > 0:
+        raise KeyError(
+            "{} are/is invalid field name(s).".format(invalid),
+            "Please choose fields from the following options: {}".format(
+                df.columns.tolist()
+            ),
+        )
+
+    grouped = df.groupby(by_fields, sort=True)
+    index = grouped.size().index
+    ids = grouped.ngroup().to_numpy()
+
+    order = np.argsort(ids, kind="stable")
+    order = order[ids[order] >= 0]
+    bounds = np.searchsorted(ids[order], np.arange(len(index) + 1))
+
+    result = {}
+    for col, func in funcs.items():
+        kernel, columns = KERNELS.get(func, (None, ()))
+        if kernel is None or not pd.api.types.is_numeric_dtype(df[col]):
+            if len(columns) > 0:
+                raise TypeError(
+                    "{} needs numeric values, {} is {}.".format(
+                        func.__name__, col, df[col].dtype
+                    )
+                )
+            result[col] = grouped[col].agg(func).to_numpy()
+            continue
+
+        values = df[col].to_numpy(dtype=float)[order]
+        extra = {i: df[i].to_numpy(dtype=float)[order] for i in columns}
+        result[col] = kernel(values, bounds, **extra)
+    return pd.DataFrame(result, index=index)
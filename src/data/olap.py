@@ -3,8 +3,8 @@ import os
 ROOT_DIR = os.path.dirname(os.path.abspath('...'))
 sys.path.insert(0, os.path.abspath(ROOT_DIR))
 
-from functools import reduce
-from copy import deepcopy
+from functools import reduce, wraps
+from copy import copy, deepcopy
 from typing import Callable
 import datetime
 import re
@@ -12,6 +12,26 @@ import re
 import pandas as pd
 import numpy as np
 
+from src.data.sketches import group_sketches
+from src.data.arraycube import ArrayCube
+from src.data.join import get_join_index
+from src.data.predicates import is_slice_predicate, prune_slices
+from src.data.grouping import aggregate_grouping_sets, cube_sets, rollup_sets
+from src.data.kernels import segmented_aggregate, uses_kernels
+from src.data.backends import get_backend
+from src.data.fingerprint import frame_fingerprint
+
+
+def _branching(method):
+    # on a snapshot the operation runs on a fork, so the snapshot never changes.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.frozen is True:
+            return method(self.fork(), *args, **kwargs)
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class Tesseract(object):
     """This class is used for the analysis and visualization of multi-dimensional
@@ -23,12 +43,20 @@ class Tesseract(object):
     Uhhg, why am I always procrastinating with testing...
     """
 
-    def __init__(self, df):
+    def __init__(self, df, backend=None, cache=None):
         """
         Parameters
         -----------
         df: pandas DataFrame
 
+        backend: str or backend object (optional)
+            Engine used for simple aggregations and filters: 'pandas' (default),
+            'sqlite' or 'duckdb'. See src.data.backends.
+
+        cache: src.data.cache.ResultCache (optional)
+            Persistent on-disk cache for group results, shared across processes and
+            kernel restarts. Queries using functions (callables) aren't cached.
+
         Attributes
         -----------
         df: pandas DataFrame
@@ -46,6 +74,9 @@ class Tesseract(object):
             Returns the current month, assumed to be the month of the datetime for the
             last row in the DataFrame.
 
+        frozen: bool
+            True for snapshots (see snapshot).
+
 
         Inherits
         ---------
@@ -54,7 +85,81 @@ class Tesseract(object):
             interactive data viz.
 
         """
+        self.df = df
+        self.backend = get_backend(backend)
+        self.cache = cache
+        self.frozen = False
+
+    def __setattr__(self, name, value):
+        # snapshots are shared, so none of their attributes (df included) can change.
+        if self.__dict__.get("frozen") is True:
+            raise AttributeError(
+                "Can't set {} on a snapshot. Use fork() for a modifiable copy.".format(
+                    name
+                )
+            )
+        super().__setattr__(name, value)
+
+    @property
+    def df(self):
+        # filters only record row positions; the rows are taken on first read.
+        if self.frozen is True:
+            # a snapshot may be read from several threads, so it's never written.
+            if self._rows is not None:
+                return self._df.take(self._rows)
+            return self._df.copy(deep=False)
+        if self._rows is not None:
+            self._df = self._df.take(self._rows)
+            self._rows = None
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self._rows = None
+
+    def fork(self):
+        """Returns an independent branch of this Tesseract without copying the data.
+
+        The branch shares the column buffers (and any pending filtered row positions)
+        with this instance. Operations replace a branch's DataFrame rather than write
+        into it, so each branch only allocates what it changes: new columns,
+        aggregates, or an index array for filtered rows.
+
+        Example
+        --------
+        base = Tesseract(df).filter([("Year", ">=", 2000)])
+        by_country = base.fork().group(["Country"], "mean")
+        by_subject = base.fork().group(["Subject"], "mean")
+
+        Returns
+        --------
+        Tesseract
+        """
+        branch = copy(self)
+        # copies of a snapshot start out frozen too.
+        object.__setattr__(branch, "frozen", False)
+        branch._df = self._df.copy(deep=False)
+        return branch
 
+    def snapshot(self):
+        """Returns an immutable fork of this Tesseract.
+
+        Operations on a snapshot (group, filter, join, view) return a new fork with
+        the result and leave the snapshot unchanged, so one snapshot can seed any
+        number of analyses. Setting its attributes (e.g. df) raises AttributeError.
+
+        Returns
+        --------
+        Tesseract
+        """
+        frozen = self.fork()
+        # takes pending filtered rows once, rather than on every read.
+        frozen.df
+        frozen.frozen = True
+        return frozen
+
+    @_branching
     def group(
         self,
         by_fields=None,
@@ -62,6 +167,10 @@ class Tesseract(object):
         by_calcs=None,
         post_agg_filter=None,
         post_calc_filter=None,
+        sketch_params=None,
+        grouping_sets=None,
+        rollup=False,
+        cube=False,
     ):
         """Dynamically applies user-defined grouping, aggregations, calculations, functions, and filters to the data.
 
@@ -72,10 +181,15 @@ class Tesseract(object):
             sequence. Order matters!
 
         aggregate_by: str, set[function], dict[str, function], or function
-            Supports simple built-in aggregations (str args): 'sum', 'mean', 'median', 'count', 'std'.
+            Supports simple built-in aggregations (str args): 'sum', 'mean', 'median', 'count', 'std',
+            'min', 'max'.
             Supports user-defined aggregation functions. To apply a single custom agg function simply pass
             the function. To apply multiple custom agg functions pass a dictionary with column names as keys
-            and the agg functions as values.
+            and the agg functions as values. Functions with a registered kernel (see
+            src.data.kernels: geometric_mean, trimmed_mean, weighted_mean) are evaluated
+            for all groups at once with segmented reductions.
+            Supports mergeable approximate aggregations (str args): 'approx_median',
+            'approx_quantile' and 'approx_nunique'. See src.data.sketches for error bounds.
 
         by_calcs: function (optional)
             User-defined function/calculation to apply to the underlying dataframe after grouping and
@@ -91,6 +205,23 @@ class Tesseract(object):
             Pandas query on the dataframe. See the pandas.DataFrame.query method
             for more information.
 
+        sketch_params: dict (optional)
+            Accuracy settings for the approximate aggregations, e.g. {'q': 0.9, 'k': 400}
+            for 'approx_quantile' or {'p': 14} for 'approx_nunique'.
+
+        grouping_sets: list[list[str]] (optional)
+            Computes several grouping levels (subsets of by_fields) in one pass, e.g.
+            [['Country', 'Subject'], ['Country'], []] for per-subject rows, country
+            subtotals and a grand total. Fields aggregated away in a level are NaN
+            and a grouping_id column marks each row's level (one bit per by_field,
+            set when the field is rolled up, first field most significant).
+
+        rollup: bool
+            Shorthand for grouping_sets over every prefix of by_fields.
+
+        cube: bool
+            Shorthand for grouping_sets over every subset of by_fields.
+
         Raises
         -------
         KeyError
@@ -107,6 +238,24 @@ class Tesseract(object):
 
         self.by_fields = by_fields
 
+        cache_key = self._cache_key(
+            "group",
+            by_fields=by_fields,
+            aggregate_by=aggregate_by,
+            by_calcs=by_calcs,
+            post_agg_filter=post_agg_filter,
+            post_calc_filter=post_calc_filter,
+            sketch_params=sketch_params,
+            grouping_sets=grouping_sets,
+            rollup=rollup,
+            cube=cube,
+        )
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.df = cached
+                return self
+
         # asserts fields passed to the by_fields arg are all valid column names.
         # should be moved to a seperate decorator.
         try:
@@ -121,24 +270,35 @@ class Tesseract(object):
                 "Please choose fields from the following options: {}".format(col_list),
             )
 
+        if cube is True:
+            grouping_sets = cube_sets(by_fields)
+        elif rollup is True:
+            grouping_sets = rollup_sets(by_fields)
+
+        # computes every grouping level at once, deriving coarse levels from fine ones.
+        if grouping_sets is not None:
+            self.df = aggregate_grouping_sets(
+                self.df, by_fields, grouping_sets, aggregate_by
+            )
+
         # groups the dataframe and applies simple aggregations.
-        if isinstance(aggregate_by, str) is True:
-            if aggregate_by == "sum":
-                self.df = self.df.groupby(by_fields).sum()
-            if aggregate_by == "mean":
-                self.df = self.df.groupby(by_fields).mean()
-            if aggregate_by == "median":
-                self.df = self.df.groupby(by_fields).median()
-            if aggregate_by == "count":
-                self.df = self.df.groupby(by_fields).count()
-            if aggregate_by == "std":
-                self.df = self.df.groupby(by_fields).std()
+        elif isinstance(aggregate_by, str) is True:
+            if aggregate_by in ("approx_median", "approx_quantile", "approx_nunique"):
+                self.df = self._approx_aggregate(
+                    by_fields, aggregate_by, **(sketch_params or {})
+                )
+            else:
+                # raises a ValueError for unsupported names.
+                self.df = self.backend.group(self.df, by_fields, aggregate_by)
 
         # groups the dataframe and applies user-defined aggregation functions
-        if (
+        elif (
             isinstance(aggregate_by, dict) or isinstance(aggregate_by, Callable)
         ) is True:
-            self.df = self.df.groupby(by_fields).agg(aggregate_by)
+            if uses_kernels(aggregate_by) is True:
+                self.df = segmented_aggregate(self.df, by_fields, aggregate_by)
+            else:
+                self.df = self.df.groupby(by_fields).agg(aggregate_by)
 
         self.df.reset_index(level=by_fields, inplace=True)
 
@@ -158,8 +318,254 @@ class Tesseract(object):
         # applies filter post-agg and post-calc
         if post_calc_filter is not None:
             self.df = self.df.query(post_calc_filter)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, self.df)
+        return self
+
+    def _cache_key(self, op, **spec):
+        # None when there's no cache or the spec can't be normalized (e.g. functions).
+        # backends return identical results, so entries are shared between them.
+        if self.cache is None:
+            return None
+        spec = dict(spec, op=op)
+        try:
+            return self.cache.key(frame_fingerprint(self.df), spec)
+        except TypeError:
+            return None
+
+    @_branching
+    def filter(self, conditions):
+        """Filters the data with the backend.
+
+        Parameters
+        -----------
+        conditions: list[tuple[str, str, object]]
+            (field, operator, value) conditions that must all hold. Operators are
+            '==', '!=', '<', '<=', '>', '>=', 'in' and 'not in'.
+
+        Returns
+        --------
+        self.df: pandas.DataFrame
+            Filtered DataFrame.
+        """
+        # conditions are row-wise, so they're evaluated on the shared frame and only
+        # the matching row positions are kept.
+        rows = self.backend.rows(self._df, conditions)
+        if len(self._df) < 2 ** 31:
+            rows = rows.astype(np.int32)
+        if self._rows is not None:
+            rows = self._rows[np.isin(self._rows, rows, assume_unique=True)]
+        self._rows = rows
+        return self
+
+    def _approx_aggregate(self, by_fields, aggregate_by, q=0.5, **params):
+        # builds mergeable sketches per group and reads the estimate off each one.
+        value_fields = [i for i in self.df.columns if i not in by_fields]
+
+        if aggregate_by == "approx_nunique":
+            sketches = self.sketch(by_fields, value_fields, kind="distinct", **params)
+            return sketches.apply(lambda col: col.map(lambda s: s.count()))
+
+        if aggregate_by == "approx_median":
+            q = 0.5
+        value_fields = [
+            i for i in value_fields if pd.api.types.is_numeric_dtype(self.df[i])
+        ]
+        sketches = self.sketch(by_fields, value_fields, kind="quantile", **params)
+        return sketches.apply(lambda col: col.map(lambda s: s.quantile(q)))
+
+    def sketch(self, by_fields, value_fields, kind="quantile", **params):
+        """Builds a mergeable sketch per group and field without modifying self.df.
+
+        Sketches from separate chunks or partitions of the data can be combined with
+        src.data.sketches.merge_sketches.
+
+        Parameters
+        -----------
+        by_fields: list[str]
+            Fields (columns) to group by.
+
+        value_fields: list[str]
+            Fields (columns) to sketch.
+
+        kind: str
+            'quantile' (KLL sketch) or 'distinct' (HyperLogLog).
+
+        params: dict
+            Sketch accuracy settings (k and c for 'quantile', p for 'distinct').
+
+        Returns
+        --------
+        pandas.DataFrame
+            Sketch objects indexed by the group keys.
+        """
+        return group_sketches(self.df, by_fields, value_fields, kind=kind, **params)
+
+    def to_array_cube(self, dims=None, measure="Value", **kwargs):
+        """Converts the DataFrame to an ndarray-backed cube for integer-indexed
+        slice, dice, roll-up and drill-down.
+
+        Parameters
+        -----------
+        dims: list[str] (optional)
+            Fields (columns) used as the cube's axes. Defaults to every column
+            except the measure.
+
+        measure: str
+            Numeric field (column) holding the values.
+
+        kwargs: dict
+            Passed to ArrayCube.from_frame (agg, format, dense_threshold).
+
+        Returns
+        --------
+        ArrayCube
+        """
+        if dims is None:
+            dims = [i for i in self.df.columns if i != measure]
+        return ArrayCube.from_frame(self.df, dims, measure=measure, **kwargs)
+
+    @_branching
+    def join(
+        self,
+        other,
+        on=("Country", "Year"),
+        how="inner",
+        filter=None,
+        other_filter=None,
+        suffixes=("_x", "_y"),
+    ):
+        """Joins another dataset on shared dimensions, reusing a cached join index.
+
+        The key index for a dataset pair is built once (see src.data.join) and reused
+        by every later join of the same pair, whatever the filters.
+
+        Parameters
+        -----------
+        other: Tesseract or pandas DataFrame
+            Dataset to join with.
+
+        on: list[str]
+            Shared dimensions (columns) to join on.
+
+        how: str
+            'inner' or 'left'.
+
+        filter: str (optional)
+            Pandas query on this dataset, applied below the join.
+
+        other_filter: str (optional)
+            Pandas query on the other dataset, applied below the join.
+
+        suffixes: tuple[str, str]
+            Appended to overlapping column names from this and the other dataset.
+
+        Raises
+        -------
+        KeyError
+            Raised if the fields in the on arg are not in both DataFrames.
+
+        Returns
+        --------
+        self.df: pandas.DataFrame
+            Joined DataFrame.
+        """
+        if isinstance(other, Tesseract) and other._rows is None:
+            # the frame itself rather than a snapshot's copy, so its key fingerprint
+            # is reused (see src.data.join.get_join_index). it's only read.
+            other_df = other._df
+        elif isinstance(other, Tesseract):
+            other_df = other.df
+        else:
+            other_df = other
+        on = list(on)
+
+        index = get_join_index(self.df, other_df, on, how=how)
+        left_mask = None if filter is None else self.df.eval(filter).to_numpy()
+        right_mask = (
+            None if other_filter is None else other_df.eval(other_filter).to_numpy()
+        )
+
+        self.df = index.apply(
+            self.df, other_df, left_mask, right_mask, suffixes=suffixes
+        )
         return self
 
+    def _slice_fields(self):
+        # the by_fields without the time dimension.
+        return [
+            i for i in self.by_fields
+            if i != "month" if i != "year" if i != "day" if i != 'date'
+        ]
+
+    def iter_view(self, by_calcs, pre_calc_filter=None, batch_size=1):
+        """Lazily applies user-defined calculations slice by slice, yielding results as
+        they are computed.
+
+        Unlike view, slices are cut one at a time: the data is grouped into row
+        positions once, and each slice is taken from self.df only when its calcs run.
+        Besides self.df and the positions, at most one slice and one batch of results
+        are held in memory. self.df is not modified.
+
+        Parameters
+        -----------
+        by_calcs: dict[functions]
+            User-defined calculations/functions to be applied to each slice.
+
+        pre_calc_filter: function, dict[str, function] or SlicePredicate (optional)
+            User-defined filter applied before application of calcs. Passed function
+            filters on a slice-by-slice basis. SlicePredicates (or a list of them)
+            prune whole slices up front (see src.data.predicates).
+
+        batch_size: int
+            Number of slices per yielded DataFrame.
+
+        Yields
+        -------
+        pandas.DataFrame
+            Up to batch_size rows with the slice fields and one column per calc,
+            in the same order as view.
+        """
+        by_fields = self._slice_fields()
+        df_all = self.df
+        if is_slice_predicate(pre_calc_filter) is True:
+            df_all = prune_slices(df_all, by_fields, pre_calc_filter)
+            pre_calc_filter = None
+        if isinstance(pre_calc_filter, dict) is True:
+            pre_calc_filter = list(pre_calc_filter.values())[0]
+
+        # slices are taken by row positions: iterating the groupby itself would build
+        # a sorted copy of the whole frame up front.
+        grouped = df_all.groupby(by_fields, sort=False)
+        index = grouped.size().index
+        ids = grouped.ngroup().to_numpy()
+        order = np.argsort(ids, kind="stable")
+        order = order[ids[order] >= 0]
+        bounds = np.searchsorted(ids[order], np.arange(len(index) + 1))
+        # only the positions are kept while slices are yielded.
+        del grouped, ids
+
+        batch = []
+        for i, keys in enumerate(index):
+            df = df_all.take(order[bounds[i] : bounds[i + 1]])
+            if pre_calc_filter is not None and not pre_calc_filter(df):
+                continue
+
+            if not isinstance(keys, tuple):
+                keys = (keys,)
+            row = dict(zip(by_fields, keys))
+            row.update({k: v(df) for k, v in by_calcs.items()})
+            batch.append(row)
+
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=by_fields + list(by_calcs))
+                batch = []
+
+        if len(batch) > 0:
+            yield pd.DataFrame(batch, columns=by_fields + list(by_calcs))
+
+    @_branching
     def view(self, by_calcs=None, pre_calc_filter=None, post_calc_filter=None):
         """Dynamically applies user-defined calculations and filters to an aggregated dataframe.
 
@@ -168,9 +574,11 @@ class Tesseract(object):
         by_calcs: dict[functions]
             User-defined calculations/functions to be applied post-aggregation.
 
-        pre_calc_filter: function or dict[str, function] (optional)
+        pre_calc_filter: function, dict[str, function] or SlicePredicate (optional)
             User-defined filter applied before application of calcs. Passed function
-            filters on a slice-by-slice basis.
+            filters on a slice-by-slice basis. SlicePredicates (or a list of them) are
+            evaluated once over the whole DataFrame with a groupby transform and prune
+            slices before any slicing (see src.data.predicates).
 
         post_calc_filter: string (optional)
             Filters the dataframe with a pandas.DataFrame.query post-application of
@@ -193,10 +601,12 @@ class Tesseract(object):
 
         # removes the time dimension from the by_fields arg. Resulting fields
         # are used to apply calculations.
-        self.by_fields = [
-            i for i in self.by_fields 
-            if i != "month" if i != "year" if i != "day" if i != 'date'
-        ]
+        self.by_fields = self._slice_fields()
+
+        # prunes slices failing declarative predicates before the dataframe is cut.
+        if is_slice_predicate(pre_calc_filter) is True:
+            self.df = prune_slices(self.df, self.by_fields, pre_calc_filter)
+            pre_calc_filter = None
 
         # code needs refactoring!
         # This is a decorator pattern!
@@ -280,15 +690,19 @@ class Tesseract(object):
                     print("Data too dirty! Attempting to clean...")
                     col_list = self.df.columns.tolist()
 
-                    # iterates over every column and tries to remove string-breaking quotes
+                    # iterates over every column and tries to remove string-breaking quotes.
+                    # cleaned columns replace the originals in a new frame, so buffers
+                    # shared with forks are never written to.
+                    cleaned = {}
                     for col in col_list:
                         try:
-                            self.df[col] = (
+                            cleaned[col] = (
                                 self.df[col].str.replace("'", "").str.replace('"', "")
                             )
                         except AttributeError as e:
                             # log error
                             continue
+                    self.df = self.df.assign(**cleaned)
 
                     df_slices_list = return_df_slices()
                     print("Data successfully clean. Horay!")
@@ -0,0 +1,127 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+import operator
+
+import numpy as np
+
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class SlicePredicate(object):
+    """Declarative slice-level filter evaluated once over the whole frame.
+
+    Compares a per-slice aggregate of a field with a value, e.g. "the slice has at
+    least 20 values" or "the latest value is positive". The aggregate is computed
+    with a single groupby transform, so slices failing the predicate are dropped
+    before any slice is cut. Predicates combine with &, | and ~.
+
+    Example
+    --------
+    has_history = SlicePredicate("Value", "count", ">=", 20)
+    growing = SlicePredicate("Value", "last", ">", 0, order_by="Year")
+    Tesseract(df).group(...).view(by_calcs, pre_calc_filter=has_history & growing)
+    """
+
+    def __init__(self, field, agg, op, value, order_by=None):
+        """
+        Parameters
+        -----------
+        field: str
+            Field (column) to aggregate per slice.
+
+        agg: str
+            Any groupby transform aggregation: 'count', 'size', 'sum', 'mean',
+            'min', 'max', 'median', 'std', 'nunique', 'first' or 'last'.
+
+        op: str
+            Comparison operator: '>', '>=', '<', '<=', '==' or '!='.
+
+        value: scalar
+            Value compared against each slice's aggregate.
+
+        order_by: str (optional)
+            Field (column) the slice is sorted by before the aggregation, e.g. 'Year'
+            so that 'last' means the latest value.
+        """
+        if op not in OPERATORS:
+            raise ValueError(
+                "{} is not a valid operator. Choose from {}.".format(
+                    op, list(OPERATORS)
+                )
+            )
+        self.field = field
+        self.agg = agg
+        self.op = op
+        self.value = value
+        self.order_by = order_by
+
+    def mask(self, df, by_fields):
+        """Returns a boolean array over the rows of df, True for rows of kept slices."""
+        if self.order_by is None:
+            aggregated = df.groupby(by_fields, sort=False)[self.field].transform(
+                self.agg
+            )
+            return OPERATORS[self.op](aggregated, self.value).to_numpy()
+
+        order = np.argsort(df[self.order_by].to_numpy(), kind="stable")
+        ordered = df.iloc[order]
+        aggregated = ordered.groupby(by_fields, sort=False)[self.field].transform(
+            self.agg
+        )
+        mask = np.empty(len(df), dtype=bool)
+        mask[order] = OPERATORS[self.op](aggregated, self.value).to_numpy()
+        return mask
+
+    def __and__(self, other):
+        return _CompoundPredicate(np.logical_and, [self, other])
+
+    def __or__(self, other):
+        return _CompoundPredicate(np.logical_or, [self, other])
+
+    def __invert__(self):
+        return _CompoundPredicate(np.logical_not, [self])
+
+    def __repr__(self):
+        order = "" if self.order_by is None else " by {}".format(self.order_by)
+        return "SlicePredicate({}({}){} {} {!r})".format(
+            self.agg, self.field, order, self.op, self.value
+        )
+
+
+class _CompoundPredicate(SlicePredicate):
+    def __init__(self, ufunc, predicates):
+        self.ufunc = ufunc
+        self.predicates = predicates
+
+    def mask(self, df, by_fields):
+        masks = [i.mask(df, by_fields) for i in self.predicates]
+        return self.ufunc(*masks)
+
+    def __repr__(self):
+        return "{}{}".format(self.ufunc.__name__, self.predicates)
+
+
+def prune_slices(df, by_fields, predicate):
+    """Drops the rows of every slice failing the predicate (or list of predicates)."""
+    if isinstance(predicate, list):
+        mask = np.logical_and.reduce([i.mask(df, by_fields) for i in predicate])
+    else:
+        mask = predicate.mask(df, by_fields)
+    return df[mask]
+
+
+def is_slice_predicate(obj):
+    if isinstance(obj, list):
+        return len(obj) > 0 and all(isinstance(i, SlicePredicate) for i in obj)
+    return isinstance(obj, SlicePredicate)
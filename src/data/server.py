@@ -0,0 +1,347 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import json
+import socket
+import time
+
+import pandas as pd
+import numpy as np
+
+from src.data.olap import Tesseract
+from src.data.backends import FILTER_OPERATORS
+
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+# Tesseract.group args a JSON spec may set. query strings (post_agg_filter,
+# post_calc_filter) and functions are never accepted from clients: pandas
+# query/eval can call methods on the data.
+GROUP_ARGS = (
+    "by_fields",
+    "aggregate_by",
+    "sketch_params",
+    "grouping_sets",
+    "rollup",
+    "cube",
+)
+
+# cubes held by each worker (threads share one copy, processes load their own once).
+_CUBES = {}
+
+
+def _init_worker(cubes):
+    for name, source in cubes.items():
+        _CUBES[name] = pd.read_csv(source) if isinstance(source, str) else source
+
+
+def run_query(spec):
+    """Runs a JSON query spec against the worker's cubes.
+
+    Spec
+    -----
+    {
+        "cube": "Productivity Growth",
+        "filter": [["Year", ">=", 2000]],         (optional, (field, op, value))
+        "columns": ["Country", "Year", "Value"],  (optional)
+        "group": {                                (optional, Tesseract.group args)
+            "by_fields": ["Country"],
+            "aggregate_by": "mean",
+            "sketch_params": {"k": 400}
+        },
+        "having": [["Value", ">", 1]]             (optional, filters the groups)
+    }
+
+    Filters are lists of (field, operator, value) conditions that must all hold,
+    with the operators of src.data.backends.FILTER_OPERATORS. Query strings are
+    rejected.
+
+    Raises
+    -------
+    KeyError
+        Raised if the cube or a field doesn't exist.
+
+    TypeError, ValueError
+        Raised if the spec isn't made of the structured parts above.
+
+    Returns
+    --------
+    dict
+        {"columns": [...], "data": [[...], ...]}
+    """
+    if not isinstance(spec, dict):
+        raise TypeError("A query spec must be a JSON object.")
+    try:
+        df = _CUBES[spec["cube"]]
+    except KeyError:
+        raise KeyError(
+            "{} is not a valid cube.".format(spec.get("cube")),
+            "Please choose from the following options: {}".format(list(_CUBES)),
+        )
+
+    tess = Tesseract(df)
+    if spec.get("filter") is not None:
+        tess.filter(_conditions(spec["filter"]))
+
+    columns = spec.get("columns")
+    if columns is not None:
+        if not isinstance(columns, list) or not all(
+            isinstance(i, str) for i in columns
+        ):
+            raise TypeError("columns must be a list of field names.")
+        tess.df = tess.df[columns]
+
+    group = spec.get("group")
+    if group is not None:
+        if not isinstance(group, dict):
+            raise TypeError("group must be a JSON object.")
+        invalid = [i for i in group if i not in GROUP_ARGS]
+        if len(invalid) > 0:
+            raise ValueError(
+                "{} are/is not supported in a JSON query spec.".format(invalid),
+                "Please choose from the following options: {}".format(list(GROUP_ARGS)),
+            )
+        if not isinstance(group.get("aggregate_by"), str):
+            raise TypeError("aggregate_by must be a str in a JSON query spec.")
+        tess.group(**group)
+
+    if spec.get("having") is not None:
+        tess.filter(_conditions(spec["having"]))
+
+    return json.loads(tess.df.to_json(orient="split", index=False))
+
+
+def _conditions(conditions):
+    # validates (field, operator, value) conditions from a JSON spec.
+    if not isinstance(conditions, list):
+        raise TypeError(
+            "Filters must be lists of [field, operator, value] conditions, "
+            "not {}.".format(type(conditions).__name__)
+        )
+    valid = []
+    for condition in conditions:
+        if not isinstance(condition, list) or len(condition) != 3:
+            raise TypeError(
+                "{} is not a [field, operator, value] condition.".format(condition)
+            )
+        field, op, value = condition
+        if op not in FILTER_OPERATORS:
+            raise ValueError(
+                "{} is not a valid operator. Choose from {}.".format(
+                    op, list(FILTER_OPERATORS)
+                )
+            )
+        if op in ("in", "not in") and not isinstance(value, list):
+            raise TypeError("{} needs a list of values.".format(op))
+        if isinstance(value, (dict, list)) and op not in ("in", "not in"):
+            raise TypeError("{} needs a single value.".format(op))
+        valid.append((field, op, value))
+    return valid
+
+
+class QueryServer(object):
+    """Local asyncio query service for Tesseract cubes.
+
+    Holds the cubes in memory, accepts newline-delimited JSON requests over TCP on
+    localhost and runs queries in a worker pool. Identical queries that arrive
+    while one is already running wait on that computation instead of starting
+    their own (single-flight).
+
+    Requests
+    ---------
+    {"op": "query", "spec": {...}}  ->  {"ok": true, "result": {...}}
+    {"op": "metrics"}               ->  {"ok": true, "result": {...}}
+    {"op": "cubes"}                 ->  {"ok": true, "result": [...]}
+
+    Errors are returned as {"ok": false, "error": "..."}. See run_query for the spec.
+    """
+
+    def __init__(
+        self, cubes, host="127.0.0.1", port=8765, workers=None, executor="thread"
+    ):
+        """
+        Parameters
+        -----------
+        cubes: dict[str, pandas DataFrame or str]
+            Cube names as keys and DataFrames (or CSV paths) as values.
+
+        host: str
+            Must be a loopback address. The service never listens on the network.
+
+        port: int
+
+        workers: int (optional)
+            Size of the worker pool. Defaults to the number of CPUs.
+
+        executor: str
+            'thread' shares one copy of the cubes across workers. 'process' gives
+            each worker its own copy, loaded once at start-up, and sidesteps the GIL.
+        """
+        if host not in LOCAL_HOSTS:
+            raise ValueError(
+                "QueryServer only listens on localhost, got {}.".format(host)
+            )
+        if executor not in ("thread", "process"):
+            raise ValueError(
+                "executor must be 'thread' or 'process', got {}.".format(executor)
+            )
+
+        self.cubes = cubes
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+
+        self._pool = None
+        self._inflight = {}
+        self._latencies = deque(maxlen=10000)
+        self._counts = {"queries": 0, "computations": 0, "coalesced": 0, "errors": 0}
+
+    def _start_pool(self):
+        if self.executor == "process":
+            self._pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.cubes,)
+            )
+        else:
+            _init_worker(self.cubes)
+            self._pool = ThreadPoolExecutor(self.workers)
+
+    async def query(self, spec):
+        """Runs a query spec, sharing the computation with identical in-flight queries."""
+        key = json.dumps(spec, sort_keys=True, separators=(",", ":"))
+        start = time.perf_counter()
+        self._counts["queries"] += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(self._pool, run_query, spec))
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+            self._inflight[key] = task
+            self._counts["computations"] += 1
+        else:
+            self._counts["coalesced"] += 1
+
+        try:
+            # shields the shared computation from a single caller being cancelled.
+            return await asyncio.shield(task)
+        except Exception:
+            self._counts["errors"] += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+    def metrics(self):
+        """Returns query counts, latency percentiles (ms) and queue depth.
+
+        in_flight is the number of distinct computations submitted to the pool and
+        not yet finished; queue_depth is the part of those waiting for a free worker.
+        """
+        latencies = np.array(self._latencies) * 1000
+        percentiles = (
+            np.percentile(latencies, [50, 95, 99]).tolist()
+            if len(latencies) > 0
+            else [None, None, None]
+        )
+        in_flight = len(self._inflight)
+        return dict(
+            self._counts,
+            in_flight=in_flight,
+            queue_depth=max(in_flight - self.workers, 0),
+            latency_ms=dict(zip(["p50", "p95", "p99"], percentiles)),
+        )
+
+    async def _respond(self, request):
+        op = request.get("op")
+        if op == "query":
+            return await self.query(request["spec"])
+        if op == "metrics":
+            return self.metrics()
+        if op == "cubes":
+            return list(self.cubes)
+        raise ValueError("{} is not a valid op.".format(op))
+
+    async def _handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            # anything that isn't a JSON request (e.g. the header lines of an HTTP
+            # request a web page sends to this port) closes the connection, so
+            # nothing after it is read.
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("A request must be a JSON object.")
+            except ValueError as e:
+                response = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+                break
+            try:
+                response = {"ok": True, "result": await self._respond(request)}
+            except Exception as e:
+                response = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+
+    async def serve(self):
+        self._start_pool()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def run(self):
+        """Blocks serving requests until interrupted."""
+        asyncio.run(self.serve())
+
+
+class QueryClient(object):
+    """Blocking client for a QueryServer, e.g. from a notebook or the dashboard."""
+
+    def __init__(self, host="127.0.0.1", port=8765, timeout=None):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile("rwb")
+
+    def _request(self, payload):
+        self._file.write(json.dumps(payload).encode() + b"\n")
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def query(self, spec):
+        """Runs a query spec (see run_query) and returns a pandas DataFrame."""
+        result = self._request({"op": "query", "spec": spec})
+        return pd.DataFrame(result["data"], columns=result["columns"])
+
+    def metrics(self):
+        return self._request({"op": "metrics"})
+
+    def cubes(self):
+        return self._request({"op": "cubes"})
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+if __name__ == "__main__":
+    server = QueryServer(
+        {
+            "Productivity Growth": ROOT_DIR + "/data/processed/productivity_growth.csv",
+            "GDP Per Capita": ROOT_DIR + "/data/processed/gdp_per_capita.csv",
+        }
+    )
+    print("Serving cubes on {}:{}...".format(server.host, server.port))
+    server.run()
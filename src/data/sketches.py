@@ -0,0 +1,309 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from copy import deepcopy
+
+import pandas as pd
+import numpy as np
+
+
+class KLLSketch(object):
+    """Mergeable streaming quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Values are kept in a hierarchy of compactors. Items at level h carry a weight
+    of 2**h; when a level overflows its capacity it is sorted and every other item
+    (random offset) is promoted to the next level. Two sketches built on separate
+    chunks or partitions can be merged and the result has the same guarantees as
+    a sketch built on the concatenated data.
+
+    Error bounds
+    -------------
+    The normalized rank error of a quantile query is roughly 2.45 / k**0.943 at
+    99% confidence (about 1.65% for the default k=200, 0.85% for k=400). That is,
+    `quantile(q)` returns a value whose true rank lies within q +/- epsilon.
+
+    Memory
+    -------
+    Retains at most about k / (1 - c) + O(log n) float64 items (~600 items or
+    ~5KB per sketch for the defaults), independent of the number of values seen.
+    """
+
+    def __init__(self, k=200, c=2 / 3, seed=None):
+        """
+        Parameters
+        -----------
+        k: int
+            Capacity of the top compactor. Controls the accuracy/memory trade-off.
+
+        c: float
+            Capacity decay between consecutive levels, 0.5 < c < 1.
+
+        seed: int (optional)
+            Seed for the random compaction offsets (for reproducible results).
+        """
+        if k < 8:
+            raise ValueError("k must be at least 8, got {}.".format(k))
+        if not 0.5 < c < 1:
+            raise ValueError("c must be in (0.5, 1), got {}.".format(c))
+
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return max(int(np.ceil(self.k * self.c ** depth)), 2)
+
+    def _size(self):
+        return sum(len(buf) for buf in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size() > self._max_size():
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+
+                buf = np.sort(self.compactors[h])
+                # an odd item out stays behind; which end is picked at random so
+                # neither tail is systematically favoured.
+                keep = np.empty(0)
+                if len(buf) % 2 == 1:
+                    if self._rng.integers(2):
+                        keep, buf = buf[-1:], buf[:-1]
+                    else:
+                        keep, buf = buf[:1], buf[1:]
+
+                promoted = buf[self._rng.integers(2)::2]
+                self.compactors[h] = keep
+                self.compactors[h + 1] = np.concatenate(
+                    [self.compactors[h + 1], promoted]
+                )
+
+    def update(self, values):
+        """Adds a scalar or an array of values to the sketch. NaNs are ignored."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Merges another KLLSketch into this one (in place) and returns self."""
+        if not isinstance(other, KLLSketch):
+            raise TypeError("Can only merge a KLLSketch with another KLLSketch.")
+
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for h, buf in enumerate(other.compactors):
+            self.compactors[h] = np.concatenate([self.compactors[h], buf])
+
+        self.n += other.n
+        self.k = max(self.k, other.k)
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate(
+            [np.full(len(buf), 2.0 ** h) for h, buf in enumerate(self.compactors)]
+        )
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Returns the approximate q-quantile (q in [0, 1]); NaN if empty."""
+        if self.n == 0:
+            return np.nan
+        items, cum_weights = self._weighted_items()
+        i = np.searchsorted(cum_weights, q * cum_weights[-1], side="left")
+        return items[min(i, len(items) - 1)]
+
+    def rank(self, value):
+        """Returns the approximate fraction of values <= value."""
+        if self.n == 0:
+            return np.nan
+        items, cum_weights = self._weighted_items()
+        i = np.searchsorted(items, value, side="right")
+        return cum_weights[i - 1] / cum_weights[-1] if i > 0 else 0.0
+
+    def __repr__(self):
+        return "KLLSketch(k={}, n={}, retained={})".format(
+            self.k, self.n, self._size()
+        )
+
+
+def _hash64(values):
+    values = np.asarray(values)
+    values = values[~pd.isna(values)]
+    return pd.util.hash_array(values)
+
+
+def _bit_length64(x):
+    # branch-free bit length of an array of uint64 values.
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(s))
+        n[big] += s
+        x[big] >>= np.uint64(s)
+    return n + (x > 0)
+
+
+class HyperLogLog(object):
+    """Mergeable distinct-count sketch (Flajolet et al., 2007).
+
+    Each value is hashed to 64 bits with pandas' stable hash; the first p bits pick
+    one of m = 2**p registers, which keeps the longest run of leading zeros seen in
+    the remaining bits. Merging two sketches takes the element-wise max of their
+    registers. Values must have the same dtype across merged chunks to hash
+    identically.
+
+    Error bounds
+    -------------
+    The relative standard error of `count()` is 1.04 / sqrt(m): about 1.6% for the
+    default p=12, 0.8% for p=14. Small cardinalities use linear counting and are
+    close to exact.
+
+    Memory
+    -------
+    m bytes per sketch (4KB for p=12).
+    """
+
+    def __init__(self, p=12):
+        """
+        Parameters
+        -----------
+        p: int
+            Register index bits, 4 <= p <= 18. Higher p means more accuracy and memory.
+        """
+        if not 4 <= p <= 18:
+            raise ValueError("p must be between 4 and 18, got {}.".format(p))
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values):
+        """Adds a scalar or an array of values to the sketch. Nulls are ignored."""
+        hashes = _hash64(np.atleast_1d(values))
+        if len(hashes) == 0:
+            return self
+
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = hashes << np.uint64(self.p)
+        rank = np.minimum(64 - _bit_length64(rest) + 1, 64 - self.p + 1)
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        """Merges another HyperLogLog into this one (in place) and returns self."""
+        if not isinstance(other, HyperLogLog) or other.p != self.p:
+            raise TypeError("Can only merge HyperLogLog sketches with the same p.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Returns the approximate number of distinct values seen."""
+        m = self.m
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # linear counting is more accurate for small cardinalities.
+            estimate = m * np.log(m / zeros)
+        return estimate
+
+    def __repr__(self):
+        return "HyperLogLog(p={}, estimate={:.0f})".format(self.p, self.count())
+
+
+SKETCHES = {"quantile": KLLSketch, "distinct": HyperLogLog}
+
+
+def group_sketches(df, by_fields, columns, kind="quantile", **params):
+    """Builds one sketch per group and column in a single pass over the grouping.
+
+    Parameters
+    -----------
+    df: pandas DataFrame
+
+    by_fields: list[str]
+        Fields (columns) to group by.
+
+    columns: list[str]
+        Columns to sketch.
+
+    kind: str
+        'quantile' (KLLSketch) or 'distinct' (HyperLogLog).
+
+    params: dict
+        Passed to the sketch constructor, e.g. k=400 or p=14.
+
+    Returns
+    --------
+    pandas.DataFrame
+        Indexed by the (sorted) group keys with a sketch object per cell.
+    """
+    try:
+        sketch_cls = SKETCHES[kind]
+    except KeyError:
+        raise ValueError(
+            "{} is not a valid sketch kind. Choose from {}.".format(
+                kind, list(SKETCHES)
+            )
+        )
+
+    grouped = df.groupby(by_fields, sort=True)
+    index = grouped.size().index
+    ids = grouped.ngroup().to_numpy()
+
+    # sorts the group ids once so each group is a contiguous segment
+    order = np.argsort(ids, kind="stable")
+    order = order[ids[order] >= 0]
+    bounds = np.searchsorted(ids[order], np.arange(len(index) + 1))
+
+    data = {}
+    for col in columns:
+        values = df[col].to_numpy()[order]
+        data[col] = [
+            sketch_cls(**params).update(values[bounds[i] : bounds[i + 1]])
+            for i in range(len(index))
+        ]
+    return pd.DataFrame(data, index=index)
+
+
+def merge_sketches(*frames):
+    """Merges sketch frames (see group_sketches) built on separate chunks or partitions.
+
+    Groups missing from a frame are taken as-is from the others. The input frames
+    are not modified.
+    """
+    merged = {}
+    for frame in frames:
+        for col in frame.columns:
+            sketches = merged.setdefault(col, {})
+            for key, sketch in frame[col].items():
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = deepcopy(sketch)
+
+    df = pd.DataFrame({col: pd.Series(sketches) for col, sketches in merged.items()})
+    df.index.names = frames[0].index.names
+    return df.sort_index()
@@ -0,0 +1,289 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+import time
+
+import pandas as pd
+import numpy as np
+
+from src.data.cache import ResultCache
+from src.data.datasets import DATASETS, load_dataset
+from src.data.fingerprint import frame_fingerprint
+
+FEATURES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data",
+    "interim",
+    "features",
+)
+
+
+class Feature(object):
+    """Base class for per-series features.
+
+    Features are computed on the series padded into a (series, years) matrix, so
+    lags and windows are measured in years (a missing year is a gap, not skipped)
+    and every series is computed in one vectorized call.
+    """
+
+    kind = None
+
+    def __init__(self, field="Value"):
+        self.field = field
+
+    @property
+    def name(self):
+        raise NotImplementedError
+
+    def config(self):
+        """JSON-serializable definition. Part of the feature's cache key."""
+        return dict(vars(self), kind=self.kind)
+
+    def compute(self, values):
+        """(series, years) matrix -> (series, years) matrix of feature values."""
+        raise NotImplementedError
+
+
+def _shift(values, periods):
+    out = np.full_like(values, np.nan)
+    out[:, periods:] = values[:, : values.shape[1] - periods]
+    return out
+
+
+class Lag(Feature):
+    """Value of the field periods years earlier."""
+
+    kind = "lag"
+
+    def __init__(self, field="Value", periods=1):
+        super().__init__(field)
+        self.periods = periods
+
+    @property
+    def name(self):
+        return "{}_lag{}".format(self.field, self.periods)
+
+    def compute(self, values):
+        return _shift(values, self.periods)
+
+
+class GrowthRate(Feature):
+    """Relative change over periods years: value / lagged value - 1."""
+
+    kind = "growth"
+
+    def __init__(self, field="Value", periods=1):
+        super().__init__(field)
+        self.periods = periods
+
+    @property
+    def name(self):
+        return "{}_growth{}".format(self.field, self.periods)
+
+    def compute(self, values):
+        lagged = _shift(values, self.periods)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = values / lagged - 1
+        growth[~np.isfinite(growth)] = np.nan
+        return growth
+
+
+class Rolling(Feature):
+    """Rolling aggregate ('mean', 'sum', 'std', 'min', 'max', 'median') over the
+    last window years, current year included."""
+
+    kind = "rolling"
+
+    def __init__(self, field="Value", window=3, agg="mean", min_periods=None):
+        super().__init__(field)
+        self.window = window
+        self.agg = agg
+        self.min_periods = window if min_periods is None else min_periods
+
+    @property
+    def name(self):
+        return "{}_rolling{}_{}".format(self.field, self.window, self.agg)
+
+    def compute(self, values):
+        # one column per series, so a single rolling call covers every series.
+        rolling = pd.DataFrame(values.T).rolling(
+            self.window, min_periods=self.min_periods
+        )
+        return rolling.agg(self.agg).to_numpy().T
+
+
+DEFAULT_FEATURES = [
+    Lag(periods=1),
+    Lag(periods=2),
+    GrowthRate(periods=1),
+    Rolling(window=3, agg="mean"),
+    Rolling(window=5, agg="std"),
+]
+
+
+class FeatureStore(object):
+    """Builds declared features for long (series, year) data and caches each one on
+    disk.
+
+    Every feature is cached separately under a key made of its definition and the
+    fingerprint of the columns it reads (series fields, time field and its input
+    field). A rebuild only computes features whose definition or input data
+    changed; the rest load memory-mapped from the cache.
+
+    Example
+    --------
+    store = FeatureStore([Lag(periods=1), Rolling(window=3)])
+    features = store.build(load_dataset("GDP Per Capita"))
+    """
+
+    def __init__(
+        self,
+        features=None,
+        series_fields=None,
+        time_field="Year",
+        directory=FEATURES_DIR,
+        max_bytes=512 * 2**20,
+    ):
+        """
+        Parameters
+        -----------
+        features: list[Feature] (optional)
+            Defaults to DEFAULT_FEATURES.
+
+        series_fields: list[str] (optional)
+            Fields identifying a series. Defaults to every non-numeric column.
+
+        time_field: str
+            Integer year field.
+
+        directory: str
+            Cache location.
+
+        max_bytes: int
+            Cache size bound (see src.data.cache.ResultCache).
+        """
+        self.features = DEFAULT_FEATURES if features is None else features
+        self.series_fields = series_fields
+        self.time_field = time_field
+        self.cache = ResultCache(directory, max_bytes=max_bytes)
+        self.computed = []
+        self.loaded = []
+
+    def _series_fields(self, df):
+        if self.series_fields is not None:
+            return list(self.series_fields)
+        return [
+            i
+            for i in df.columns
+            if i != self.time_field and not pd.api.types.is_numeric_dtype(df[i])
+        ]
+
+    def build(self, df):
+        """Returns the features for every row of df.
+
+        Parameters
+        -----------
+        df: pandas DataFrame
+            Long data as in data/processed.
+
+        Raises
+        -------
+        KeyError
+            Raised if a feature's field or the time field is not in the DataFrame.
+
+        Returns
+        --------
+        pandas.DataFrame
+            df's series and time fields plus one column per feature, in df's row
+            order and index. self.computed and self.loaded list the features that
+            were computed or read from the cache.
+        """
+        series_fields = self._series_fields(df)
+        fields = [self.time_field] + [i.field for i in self.features]
+        invalid = [i for i in fields if i not in df.columns]
+        if len(invalid) > 0:
+            raise KeyError(
+                "{} are/is invalid field name(s).".format(invalid),
+                "Please choose fields from the following options: {}".format(
+                    df.columns.tolist()
+                ),
+            )
+
+        self.computed, self.loaded = [], []
+        positions = None
+        # input fingerprints are shared by every feature on the same field.
+        fingerprints = {}
+        columns = {}
+        for feature in self.features:
+            if feature.field not in fingerprints:
+                fingerprints[feature.field] = frame_fingerprint(
+                    df, columns=series_fields + [self.time_field, feature.field]
+                )
+            key = self.cache.key(
+                fingerprints[feature.field],
+                {
+                    "feature": feature.config(),
+                    "series_fields": series_fields,
+                    "time_field": self.time_field,
+                },
+            )
+
+            cached = self.cache.get(key)
+            if cached is not None:
+                columns[feature.name] = cached[feature.name].to_numpy()
+                self.loaded.append(feature.name)
+                continue
+
+            if positions is None:
+                positions = self._positions(df, series_fields)
+            ids, t, kept, shape = positions
+            values = np.full(shape, np.nan)
+            values[ids, t] = df[feature.field].to_numpy(dtype=float)[kept]
+            result = np.full(len(df), np.nan)
+            result[kept] = feature.compute(values)[ids, t]
+
+            self.cache.put(key, pd.DataFrame({feature.name: result}))
+            columns[feature.name] = result
+            self.computed.append(feature.name)
+
+        out = df[series_fields + [self.time_field]].copy()
+        for name, values in columns.items():
+            out[name] = values
+        return out
+
+    def _positions(self, df, series_fields):
+        # (series, year column) of every row in the padded matrix. rows with a null
+        # series field aren't part of any series.
+        ids = df.groupby(series_fields, sort=False).ngroup().to_numpy()
+        years = df[self.time_field].to_numpy().astype(np.int64)
+        t = years - years.min()
+        kept = ids >= 0
+        shape = (ids.max() + 1, years.max() - years.min() + 1)
+        return ids[kept], t[kept], kept, shape
+
+
+def build_dataset_features(name, features=None, **kwargs):
+    """Builds (or loads) the features of one of the processed datasets."""
+    return FeatureStore(features, **kwargs).build(load_dataset(name))
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 120)
+    for name in DATASETS:
+        df = load_dataset(name)
+        store = FeatureStore()
+        for run in ("first", "second"):
+            start = time.perf_counter()
+            features = store.build(df)
+            print(
+                "{} ({} build): {:.1f} ms, computed {}, loaded {}".format(
+                    name,
+                    run,
+                    (time.perf_counter() - start) * 1000,
+                    len(store.computed),
+                    len(store.loaded),
+                )
+            )
+        print(features.tail())
@@ -0,0 +1,244 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import time
+
+import pandas as pd
+import numpy as np
+
+from src.data.datasets import DATASETS, load_dataset
+from src.models.train_model import MODELS, SeriesMatrix, get_model
+
+# series matrix and per-model prefix statistics held by each worker. statistics
+# are computed once per worker and model, then shared by every fold.
+_MATRIX = {}
+_STATS = {}
+
+
+def _init_worker(values, years):
+    _MATRIX["matrix"] = SeriesMatrix(values, None, years)
+    _STATS.clear()
+
+
+def _statistics(config):
+    key = json.dumps(config, sort_keys=True)
+    if key not in _STATS:
+        start = time.perf_counter()
+        stats = get_model(config).statistics(_MATRIX["matrix"])
+        _STATS[key] = (stats, time.perf_counter() - start)
+        return stats, _STATS[key][1]
+    return _STATS[key][0], 0.0
+
+
+def _evaluate_fold(config, cutoff, horizon):
+    # fits one model at one cutoff column and scores its forecasts per series.
+    matrix = _MATRIX["matrix"]
+    model = get_model(config)
+    stats, stats_seconds = _statistics(config)
+
+    start = time.perf_counter()
+    params = model.solve(matrix, stats, cutoff)
+    solve_seconds = time.perf_counter() - start
+
+    # only series observed at the cutoff are scored, so every forecast starts at
+    # the same year.
+    scored = params["origin"] == cutoff
+    start = time.perf_counter()
+    forecast = model.forecast({k: v[scored] for k, v in params.items()}, horizon)
+    forecast_seconds = time.perf_counter() - start
+
+    actual = np.full((scored.sum(), horizon), np.nan)
+    future = matrix.values[scored, cutoff + 1 : cutoff + 1 + horizon]
+    actual[:, : future.shape[1]] = future
+
+    error = forecast - actual
+    valid = ~np.isnan(error)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = np.abs(actual) + np.abs(forecast)
+        smape = np.where(denom == 0, 0.0, 200 * np.abs(error) / denom)
+
+    sums = {
+        "count": valid.sum(axis=1),
+        "abs": np.where(valid, np.abs(error), 0.0).sum(axis=1),
+        "sq": np.where(valid, error**2, 0.0).sum(axis=1),
+        "smape": np.where(valid, smape, 0.0).sum(axis=1),
+    }
+    return {
+        "model": model.name,
+        "cutoff": cutoff,
+        "rows": np.flatnonzero(scored),
+        "sums": sums,
+        "stats_seconds": stats_seconds,
+        "solve_seconds": solve_seconds,
+        "forecast_seconds": forecast_seconds,
+    }
+
+
+def rolling_origin_cutoffs(matrix, first_year=None, last_year=None, step=1, horizon=5):
+    """Returns the cutoff years of rolling-origin folds: a model is fitted on the
+    data up to each cutoff and scored on the horizon years after it.
+
+    Defaults to every year from 15 years before the last one, to horizon years
+    before it.
+    """
+    years = matrix.years
+    if last_year is None:
+        last_year = years[-1] - horizon
+    if first_year is None:
+        first_year = max(years[0] + 2, years[-1] - 15)
+    return list(range(int(first_year), int(last_year) + 1, step))
+
+
+def backtest(matrix, models=None, cutoffs=None, horizon=5, workers=1, by=None):
+    """Rolling-origin backtest of forecasting models over every series.
+
+    Each model's prefix statistics (see src.models.train_model.ForecastModel) are
+    computed once and shared by all folds, so a fold only solves for parameters at
+    its cutoff instead of refitting on the truncated data. (model, fold) pairs are
+    distributed over a process pool when workers > 1; each worker computes the
+    statistics of a model once.
+
+    Parameters
+    -----------
+    matrix: SeriesMatrix
+
+    models: list (optional)
+        Models to evaluate (see src.models.train_model.fit_models). Defaults to
+        every model.
+
+    cutoffs: list[int] (optional)
+        Cutoff years. Defaults to rolling_origin_cutoffs(matrix, horizon=horizon).
+
+    horizon: int
+        Number of years forecasted and scored after each cutoff.
+
+    workers: int
+        Number of processes.
+
+    by: list[str] (optional)
+        Series fields (e.g. ['Measure']) the accuracy is broken down by.
+
+    Raises
+    -------
+    KeyError
+        Raised if the by fields are not series fields.
+
+    Returns
+    --------
+    accuracy: pandas.DataFrame
+        Per model, cutoff (and by fields): scored series, forecasts, MAE, RMSE and
+        sMAPE (percent).
+
+    timings: pandas.DataFrame
+        Per model: folds, seconds spent on statistics, solving and forecasting, and
+        fits (series x folds) per second.
+    """
+    by = list(by or [])
+    invalid = [i for i in by if i not in matrix.keys.columns]
+    if len(invalid) > 0:
+        raise KeyError(
+            "{} are/is invalid field name(s).".format(invalid),
+            "Please choose fields from the following options: {}".format(
+                matrix.keys.columns.tolist()
+            ),
+        )
+
+    configs = [get_model(i).config() for i in (models or list(MODELS))]
+    if cutoffs is None:
+        cutoffs = rolling_origin_cutoffs(matrix, horizon=horizon)
+    columns = [int(i - matrix.years[0]) for i in cutoffs]
+    tasks = [(config, c, horizon) for config in configs for c in columns]
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(matrix.values, matrix.years)
+        ) as pool:
+            results = list(pool.map(_evaluate_fold, *zip(*tasks)))
+    else:
+        _init_worker(matrix.values, matrix.years)
+        results = [_evaluate_fold(*i) for i in tasks]
+    wall = time.perf_counter() - start
+
+    frames = []
+    for r in results:
+        frame = matrix.keys.iloc[r["rows"]][by].reset_index(drop=True)
+        frame["model"] = r["model"]
+        frame["cutoff"] = int(matrix.years[r["cutoff"]])
+        for k, v in r["sums"].items():
+            frame[k] = v
+        frames.append(frame)
+    errors = pd.concat(frames, ignore_index=True)
+    errors = errors[errors["count"] > 0]
+    errors["series"] = 1
+
+    sums = errors.groupby(["model", "cutoff"] + by, sort=True)[
+        ["series", "count", "abs", "sq", "smape"]
+    ].sum()
+    accuracy = pd.DataFrame(
+        {
+            "series": sums["series"],
+            "forecasts": sums["count"],
+            "MAE": sums["abs"] / sums["count"],
+            "RMSE": np.sqrt(sums["sq"] / sums["count"]),
+            "sMAPE": sums["smape"] / sums["count"],
+        }
+    )
+
+    timings = (
+        pd.DataFrame(results)
+        .groupby("model", sort=False)[
+            ["stats_seconds", "solve_seconds", "forecast_seconds"]
+        ]
+        .sum()
+    )
+    timings.insert(0, "folds", len(columns))
+    timings["fits_per_sec"] = (
+        len(matrix)
+        * len(columns)
+        / timings[["stats_seconds", "solve_seconds"]].sum(axis=1)
+    )
+    timings.attrs["wall_seconds"] = wall
+    return accuracy, timings
+
+
+def summarize(accuracy, by=None):
+    """Averages a backtest's accuracy over the folds, weighting each fold by its
+    number of forecasts, per model (and by fields)."""
+    keys = ["model"] + list(by or [])
+    weights = accuracy["forecasts"]
+    weighted = accuracy[["MAE", "sMAPE"]].mul(weights, axis=0)
+    weighted["MSE"] = accuracy["RMSE"] ** 2 * weights
+    weighted["forecasts"] = weights
+    sums = weighted.groupby(level=keys).sum()
+    return pd.DataFrame(
+        {
+            "MAE": sums["MAE"] / sums["forecasts"],
+            "RMSE": np.sqrt(sums["MSE"] / sums["forecasts"]),
+            "sMAPE": sums["sMAPE"] / sums["forecasts"],
+        }
+    )
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 120)
+    pd.set_option("display.max_colwidth", 40)
+    for name in DATASETS:
+        matrix = SeriesMatrix.from_frame(load_dataset(name))
+        accuracy, timings = backtest(
+            matrix, workers=os.cpu_count() or 1, by=["Measure"]
+        )
+        print(
+            "{}: {} series, {:.2f} s".format(
+                name, len(matrix), timings.attrs["wall_seconds"]
+            )
+        )
+        print(timings.round(4))
+        summary = summarize(accuracy, by=["Measure"])
+        print(summary.round(3))
+        print("Best model per measure (sMAPE):")
+        print(summary["sMAPE"].unstack("model").idxmin(axis=1))
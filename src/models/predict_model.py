@@ -0,0 +1,404 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+import json
+import queue
+import threading
+import time
+
+import pandas as pd
+import numpy as np
+
+from src.models.train_model import MODELS_DIR, current_version, get_model
+
+
+def load_models(directory, version=None, mmap=True):
+    """Reads parameters written by src.models.train_model.save_models.
+
+    Parameters
+    -----------
+    directory: str
+
+    version: str (optional)
+        Defaults to the current version.
+
+    mmap: bool
+
+    Raises
+    -------
+    FileNotFoundError
+        Raised if no models were saved in directory.
+
+    Returns
+    --------
+    meta: dict
+    params: dict[str, dict[str, numpy.ndarray]]
+        Memory-mapped (read-only) arrays when mmap is True.
+    """
+    if version is None:
+        version = current_version(directory)
+    if version is None:
+        raise FileNotFoundError("No saved models in {}.".format(directory))
+    directory = os.path.join(directory, version)
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    params = {}
+    for config in meta["models"]:
+        path = os.path.join(directory, config["name"])
+        params[config["name"]] = {
+            i[: -len(".npy")]: np.load(
+                os.path.join(path, i), mmap_mode="r" if mmap else None
+            )
+            for i in os.listdir(path)
+            if i.endswith(".npy")
+        }
+    return meta, params
+
+
+class _Loaded(object):
+    # one loaded model version. replaced as a whole on reload, so a forecast reads
+    # keys and parameters of the same version.
+    def __init__(self, meta, params):
+        self.meta = meta
+        self.params = params
+        self.version = meta["version"]
+        self.models = {i["name"]: get_model(i) for i in meta["models"]}
+        self.series_fields = meta["series_fields"]
+        self.year0 = meta["years"][0]
+        self.rows = {tuple(k): i for i, k in enumerate(meta["keys"])}
+
+
+class Predictor(object):
+    """Serves forecasts from fitted parameters.
+
+    The parameters are loaded once, memory-mapped, and forecasts for any number of
+    series are computed in one vectorized call per model. Results are cached per
+    (series, horizon, model, model version), so repeated requests (e.g. dashboard
+    reruns) skip the computation. Retraining saves a new version (see
+    src.models.train_model.save_models); reload() switches to it, and cached
+    forecasts of the old version are no longer used.
+    """
+
+    def __init__(self, directory, cache_size=100000):
+        """
+        Parameters
+        -----------
+        directory: str
+            Directory written by src.models.train_model.save_models.
+
+        cache_size: int
+            Number of (series, horizon, model) forecasts kept in memory.
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = None
+        self.reload()
+
+    def reload(self):
+        """Switches to the current saved version, e.g. after retraining.
+
+        Returns
+        --------
+        bool
+            True if a new version was loaded.
+        """
+        version = current_version(self.directory)
+        if self._loaded is not None and version == self._loaded.version:
+            return False
+        meta, params = load_models(self.directory, version)
+        self._loaded = _Loaded(meta, params)
+        return True
+
+    @property
+    def meta(self):
+        return self._loaded.meta
+
+    @property
+    def params(self):
+        return self._loaded.params
+
+    @property
+    def version(self):
+        return self._loaded.version
+
+    @property
+    def models(self):
+        return self._loaded.models
+
+    @property
+    def series_fields(self):
+        return self._loaded.series_fields
+
+    @property
+    def keys(self):
+        """Every series as a DataFrame of series fields."""
+        return pd.DataFrame(self.meta["keys"], columns=self.series_fields)
+
+    def select(self, **fields):
+        """Returns the series keys matching field values, e.g.
+        select(Country=['France', 'Japan'], Subject='GDP per head of population')."""
+        keys = self.keys
+        mask = np.ones(len(keys), dtype=bool)
+        for field, value in fields.items():
+            if field not in keys.columns:
+                raise KeyError(
+                    "{} is an invalid field name.".format(field),
+                    "Please choose fields from the following options: {}".format(
+                        self.series_fields
+                    ),
+                )
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= keys[field].isin(values).to_numpy()
+        return [tuple(i) for i in keys[mask].values.tolist()]
+
+    @staticmethod
+    def _row(loaded, key):
+        try:
+            return loaded.rows[tuple(key)]
+        except KeyError:
+            raise KeyError(
+                "{} is not a fitted series.".format(key),
+                "Series are keyed by: {}".format(loaded.series_fields),
+            )
+
+    @staticmethod
+    def _model(loaded, model):
+        try:
+            return loaded.models[model]
+        except KeyError:
+            raise ValueError(
+                "{} is not a fitted model. Choose from {}.".format(
+                    model, list(loaded.models)
+                )
+            )
+
+    def forecast(self, series, horizon=5, model="linear_trend"):
+        """Forecasts values for many series at once.
+
+        Parameters
+        -----------
+        series: list[tuple]
+            Series keys (values of the series fields, see keys and select).
+
+        horizon: int
+            Number of years after each series' last observation.
+
+        model: str
+            Fitted model name.
+
+        Raises
+        -------
+        KeyError
+            Raised if a series wasn't fitted.
+
+        Returns
+        --------
+        values: numpy.ndarray
+            (series, horizon) forecasts.
+
+        years: numpy.ndarray
+            (series, horizon) years forecasted (NaN for series without data).
+        """
+        return self._forecast(self._loaded, series, horizon, model)
+
+    def _forecast(self, loaded, series, horizon, model):
+        forecaster = self._model(loaded, model)
+        rows = np.array([self._row(loaded, i) for i in series], dtype=np.int64)
+        version = loaded.version
+
+        values = np.empty((len(rows), horizon))
+        missing = []
+        with self._lock:
+            for i, row in enumerate(rows):
+                cached = self._cache.get((row, horizon, model, version))
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end((row, horizon, model, version))
+                    values[i] = cached
+
+        if len(missing) > 0:
+            # one vectorized call for every uncached series.
+            params = loaded.params[model]
+            subset = rows[missing]
+            computed = forecaster.forecast(
+                {k: np.asarray(v[subset]) for k, v in params.items()}, horizon
+            )
+            values[missing] = computed
+            with self._lock:
+                for row, value in zip(subset, computed):
+                    self._cache[(row, horizon, model, version)] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        origin = np.asarray(loaded.params[model]["origin"][rows])
+        years = loaded.year0 + origin[:, None] + np.arange(1, horizon + 1)
+        return values, years
+
+    def predict(self, series, horizon=5, model="linear_trend"):
+        """Like forecast, as a long DataFrame with the series fields, Year and Value."""
+        if len(series) == 0:
+            # e.g. select() with every country cleared.
+            self._model(self._loaded, model)
+            return pd.DataFrame(columns=self.series_fields + ["Year", "Value"]).astype(
+                {"Year": int, "Value": float}
+            )
+        values, years = self.forecast(series, horizon, model)
+        keys = pd.DataFrame(
+            np.repeat(
+                np.array(series, dtype=object).reshape(len(series), -1), horizon, axis=0
+            ),
+            columns=self.series_fields,
+        )
+        keys["Year"] = years.ravel()
+        keys["Value"] = values.ravel()
+        return keys.dropna(subset=["Year"]).astype({"Year": int})
+
+
+class MicroBatcher(object):
+    """Collects concurrent forecast requests and evaluates them together.
+
+    Requests submitted from many threads (e.g. dashboard sessions) are queued; a
+    background thread waits up to max_wait seconds for up to max_batch requests,
+    then answers all requests for the same (horizon, model) with one
+    Predictor.forecast call.
+
+    Example
+    --------
+    batcher = MicroBatcher(Predictor(directory))
+    values, years = batcher.submit(("France", "GDP", "USD"), horizon=5).result()
+    """
+
+    def __init__(self, predictor, max_batch=256, max_wait=0.002):
+        """
+        Parameters
+        -----------
+        predictor: Predictor
+
+        max_batch: int
+            Most requests evaluated together.
+
+        max_wait: float
+            Seconds the first request of a batch waits for others.
+        """
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, series, horizon=5, model="linear_trend"):
+        """Queues a forecast for one series.
+
+        Returns
+        --------
+        concurrent.futures.Future
+            Resolves to (values, years) arrays of length horizon.
+        """
+        future = Future()
+        self._queue.put((tuple(series), horizon, model, future))
+        return future
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+            self._evaluate(batch)
+
+    def _evaluate(self, batch):
+        self.batches += 1
+        groups = {}
+        for series, horizon, model, future in batch:
+            groups.setdefault((horizon, model), []).append((series, future))
+
+        # the whole batch uses one version, even if the predictor reloads meanwhile.
+        loaded = self.predictor._loaded
+        for (horizon, model), requests in groups.items():
+            try:
+                # a bad series fails its own request, not the whole group.
+                valid = []
+                for series, future in requests:
+                    try:
+                        self.predictor._row(loaded, series)
+                        valid.append((series, future))
+                    except KeyError as e:
+                        future.set_exception(e)
+                if len(valid) == 0:
+                    continue
+                values, years = self.predictor._forecast(
+                    loaded, [i[0] for i in valid], horizon, model
+                )
+                for i, (_, future) in enumerate(valid):
+                    future.set_result((values[i], years[i]))
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def close(self):
+        """Stops the background thread after the queued requests are answered."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+@lru_cache(maxsize=8)
+def get_predictor(directory):
+    """Shared Predictor per directory (e.g. one per dataset for the dashboard)."""
+    return Predictor(directory)
+
+
+if __name__ == "__main__":
+    directory = os.path.join(MODELS_DIR, "gdp_per_capita")
+    if current_version(directory) is None:
+        print(
+            "No fitted models in {}. Run src/models/train_model.py first.".format(
+                directory
+            )
+        )
+        sys.exit(1)
+
+    predictor = Predictor(directory)
+    series = predictor.select(Country=["France", "Japan"])
+    print(predictor.predict(series[:2], horizon=3).to_string(index=False))
+
+    # simulated concurrent sessions, each asking for a few series.
+    keys = [tuple(i) for i in predictor.meta["keys"]]
+    batcher = MicroBatcher(predictor)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(32) as pool:
+        futures = [
+            pool.submit(lambda k: batcher.submit(k, horizon=5, model="ar").result(), k)
+            for k in keys
+        ]
+        [i.result() for i in futures]
+    seconds = time.perf_counter() - start
+    batcher.close()
+    print(
+        "{} requests in {:.1f} ms ({} batches)".format(
+            len(keys), seconds * 1000, batcher.batches
+        )
+    )
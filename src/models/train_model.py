@@ -0,0 +1,558 @@
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.abspath('...'))
+sys.path.insert(0, os.path.abspath(ROOT_DIR))
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import numpy as np
+
+from src.data.datasets import DATASETS, load_dataset
+from src.data.fingerprint import frame_fingerprint
+
+MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "models",
+)
+
+
+class SeriesMatrix(object):
+    """Many yearly series padded into one matrix: a row per series, a column per
+    year from the first to the last year in the data, NaN where a series has no
+    value.
+
+    Attributes
+    -----------
+    values: numpy.ndarray
+        (series, years) float matrix.
+
+    keys: pandas DataFrame
+        One row per series with its series fields (e.g. Country, Subject, Measure).
+
+    years: numpy.ndarray
+        Year of each column.
+    """
+
+    def __init__(self, values, keys, years):
+        self.values = values
+        self.keys = keys
+        self.years = years
+
+    @classmethod
+    def from_frame(cls, df, series_fields=None, time_field="Year", value_field="Value"):
+        """Pivots a long DataFrame (as in data/processed) into a SeriesMatrix.
+
+        Parameters
+        -----------
+        df: pandas DataFrame
+
+        series_fields: list[str] (optional)
+            Fields identifying a series. Defaults to every column except the time
+            and value fields.
+
+        time_field: str
+            Integer year field.
+
+        value_field: str
+            Numeric field forecasted.
+
+        Raises
+        -------
+        KeyError
+            Raised if the fields are not in the DataFrame.
+        """
+        if series_fields is None:
+            series_fields = [i for i in df.columns if i not in (time_field, value_field)]
+        invalid = [
+            i for i in list(series_fields) + [time_field, value_field]
+            if i not in df.columns
+        ]
+        if len(invalid) > 0:
+            raise KeyError(
+                "{} are/is invalid field name(s).".format(invalid),
+                "Please choose fields from the following options: {}".format(
+                    df.columns.tolist()
+                ),
+            )
+
+        grouped = df.groupby(series_fields, sort=True)
+        ids = grouped.ngroup().to_numpy()
+        keys = grouped.size().index.to_frame(index=False)
+
+        t = df[time_field].to_numpy().astype(np.int64)
+        years = np.arange(t.min(), t.max() + 1)
+        values = np.full((len(keys), len(years)), np.nan)
+        # rows with a null series field aren't part of any series.
+        kept = ids >= 0
+        values[ids[kept], t[kept] - years[0]] = df[value_field].to_numpy(dtype=float)[kept]
+        return cls(values, keys, years)
+
+    @property
+    def mask(self):
+        return ~np.isnan(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def take(self, rows):
+        """Returns the SeriesMatrix of a subset of the series."""
+        return SeriesMatrix(
+            self.values[rows], self.keys.iloc[rows].reset_index(drop=True), self.years
+        )
+
+
+def last_observed(mask):
+    """(series, years) column index of the last observed value at or before each
+    column, -1 before the first observation."""
+    idx = np.where(mask, np.arange(mask.shape[1]), -1)
+    return np.maximum.accumulate(idx, axis=1)
+
+
+def _origin(matrix, cutoff):
+    # forecasts start after each series' last observation up to the cutoff column.
+    origin = last_observed(matrix.mask)[:, cutoff].astype(float)
+    origin[origin < 0] = np.nan
+    return origin
+
+
+class ForecastModel(object):
+    """Base class for forecasting models fitted on every series at once.
+
+    A fit is split in two steps so that backtests can fit at many cutoffs cheaply:
+    statistics(matrix) computes per-series running (prefix) statistics over the
+    years in one vectorized pass, and solve(matrix, stats, cutoff) turns the
+    statistics at a cutoff column into parameters, as if the series ended there.
+
+    Parameters are a dict of arrays with one row per series. Every model returns
+    'origin', the column index of the last observation used (NaN if none);
+    forecast(params, horizon) returns (series, horizon) values for the years after
+    it.
+    """
+
+    name = None
+
+    def config(self):
+        """JSON-serializable settings; MODELS[config['name']](**kwargs) rebuilds the
+        model."""
+        return {"name": self.name}
+
+    def statistics(self, matrix):
+        raise NotImplementedError
+
+    def solve(self, matrix, stats, cutoff):
+        raise NotImplementedError
+
+    def forecast(self, params, horizon):
+        raise NotImplementedError
+
+    def fit(self, matrix):
+        """Fits every series on all of its observations."""
+        return self.solve(matrix, self.statistics(matrix), matrix.values.shape[1] - 1)
+
+
+class LinearTrend(ForecastModel):
+    """Least-squares line through each series: y = intercept + slope * t.
+
+    The fit only needs five running sums per series (n, sum t, sum t^2, sum y,
+    sum t*y), so fits at every cutoff come from one cumulative sum.
+    """
+
+    name = "linear_trend"
+    log = False
+
+    def statistics(self, matrix):
+        mask = matrix.mask
+        y = np.where(mask, matrix.values, 0.0)
+        bad = np.zeros_like(y)
+        if self.log is True:
+            # a log-linear trend is undefined for series with values <= 0.
+            bad = (mask & (y <= 0)).astype(float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                y = np.where(mask & (y > 0), np.log(y), 0.0)
+        t = np.arange(y.shape[1], dtype=float)
+        m = mask.astype(float)
+        sums = np.stack([m, m * t, m * t ** 2, y, y * t, bad], axis=-1)
+        return np.cumsum(sums, axis=1)
+
+    def solve(self, matrix, stats, cutoff):
+        n, st, stt, sy, sty, bad = np.moveaxis(stats[:, cutoff], -1, 0)
+        det = n * stt - st ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (n * sty - st * sy) / det
+            intercept = (sy - slope * st) / n
+        invalid = (n < 2) | (det <= 0) | (bad > 0)
+        slope[invalid] = np.nan
+        intercept[invalid] = np.nan
+        return {
+            "intercept": intercept,
+            "slope": slope,
+            "origin": _origin(matrix, cutoff),
+        }
+
+    def forecast(self, params, horizon):
+        t = params["origin"][:, None] + np.arange(1, horizon + 1)
+        values = params["intercept"][:, None] + params["slope"][:, None] * t
+        return np.exp(values) if self.log is True else values
+
+
+class LogLinearTrend(LinearTrend):
+    """Linear trend of log(y), i.e. constant growth. Series with values <= 0 (e.g.
+    growth rates) aren't fitted."""
+
+    name = "log_linear_trend"
+    log = True
+
+
+class AutoRegressive(ForecastModel):
+    """AR(p) with intercept: y[t] = c + phi_1 * y[t-1] + ... + phi_p * y[t-p].
+
+    Every series' normal equations (X'X, X'y) are accumulated as running sums over
+    the years and solved together with one batched numpy.linalg.solve. Years where
+    the target or any lag is missing are skipped.
+    """
+
+    name = "ar"
+
+    def __init__(self, p=2):
+        self.p = p
+
+    def config(self):
+        return {"name": self.name, "p": self.p}
+
+    def statistics(self, matrix):
+        p = self.p
+        values = matrix.values
+        n, T = values.shape
+
+        # design rows [1, y[t-1], ..., y[t-p]] for every series and year.
+        design = np.full((n, T, p + 1), np.nan)
+        design[:, :, 0] = 1.0
+        for i in range(1, p + 1):
+            design[:, i:, i] = values[:, :-i]
+        valid = ~np.isnan(values) & ~np.isnan(design).any(axis=-1)
+        design = np.where(valid[..., None], design, 0.0)
+        y = np.where(valid, values, 0.0)
+
+        xtx = np.cumsum(design[..., :, None] * design[..., None, :], axis=1)
+        xty = np.cumsum(design * y[..., None], axis=1)
+        return {"xtx": xtx, "xty": xty, "count": np.cumsum(valid, axis=1)}
+
+    def solve(self, matrix, stats, cutoff):
+        p = self.p
+        xtx = stats["xtx"][:, cutoff]
+        xty = stats["xty"][:, cutoff]
+        ok = stats["count"][:, cutoff] >= p + 2
+
+        coef = np.full(xty.shape, np.nan)
+        if ok.any():
+            a, b = xtx[ok], xty[ok]
+            # a tiny ridge, relative to each diagonal entry so it doesn't depend on
+            # the series' scale, keeps near-singular systems (e.g. flat series) solvable.
+            diag = np.diagonal(a, axis1=1, axis2=2)
+            a = a + 1e-10 * diag[:, :, None] * np.eye(p + 1)
+            try:
+                coef[ok] = np.linalg.solve(a, b[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                coef[ok] = (np.linalg.pinv(a) @ b[..., None])[..., 0]
+
+        origin = _origin(matrix, cutoff)
+        # the p most recent values up to the origin, latest first.
+        idx = np.nan_to_num(origin, nan=-1).astype(np.int64)[:, None] - np.arange(p)
+        lags = np.take_along_axis(matrix.values, np.clip(idx, 0, None), axis=1)
+        lags[idx < 0] = np.nan
+        return {
+            "intercept": coef[:, 0],
+            "phi": coef[:, 1:],
+            "lags": lags,
+            "origin": origin,
+        }
+
+    def forecast(self, params, horizon):
+        lags = params["lags"].copy()
+        out = np.empty((len(lags), horizon))
+        for h in range(horizon):
+            out[:, h] = params["intercept"] + (params["phi"] * lags).sum(axis=1)
+            lags = np.concatenate([out[:, h : h + 1], lags[:, :-1]], axis=1)
+        return out
+
+
+class ExponentialSmoothing(ForecastModel):
+    """Simple exponential smoothing with the smoothing factor chosen per series from
+    a grid by one-step-ahead squared error.
+
+    Every series and every alpha in the grid is smoothed together, year by year.
+    The level and running error after each year are kept, so fits at any cutoff
+    are a lookup.
+    """
+
+    name = "ses"
+
+    def __init__(self, alphas=None):
+        if alphas is None:
+            alphas = np.round(np.arange(0.05, 1.0, 0.05), 2).tolist()
+        self.alphas = list(alphas)
+
+    def config(self):
+        return {"name": self.name, "alphas": self.alphas}
+
+    def statistics(self, matrix):
+        values = matrix.values
+        n, T = values.shape
+        alphas = np.asarray(self.alphas)
+
+        level = np.full((n, len(alphas)), np.nan)
+        sse = np.zeros((n, len(alphas)))
+        levels = np.empty((n, T, len(alphas)))
+        errors = np.empty((n, T, len(alphas)))
+        for t in range(T):
+            y = values[:, t : t + 1]
+            observed = ~np.isnan(y)
+            started = ~np.isnan(level)
+            step = observed & started
+            error = np.where(step, y - level, 0.0)
+            sse = sse + error ** 2
+            level = np.where(step, level + alphas * error, level)
+            # the first observation initializes the level.
+            level = np.where(observed & ~started, y, level)
+            levels[:, t] = level
+            errors[:, t] = sse
+        return {"levels": levels, "sse": errors}
+
+    def solve(self, matrix, stats, cutoff):
+        sse = stats["sse"][:, cutoff]
+        best = np.argmin(sse, axis=1)
+        rows = np.arange(len(best))
+        return {
+            "alpha": np.asarray(self.alphas)[best],
+            "level": stats["levels"][rows, cutoff, best],
+            "origin": _origin(matrix, cutoff),
+        }
+
+    def forecast(self, params, horizon):
+        return np.repeat(params["level"][:, None], horizon, axis=1)
+
+
+MODELS = {
+    LinearTrend.name: LinearTrend,
+    LogLinearTrend.name: LogLinearTrend,
+    AutoRegressive.name: AutoRegressive,
+    ExponentialSmoothing.name: ExponentialSmoothing,
+}
+
+
+def get_model(model):
+    """Returns a model instance from a name, a config dict or an instance."""
+    if isinstance(model, ForecastModel):
+        return model
+    if isinstance(model, str):
+        model = {"name": model}
+    config = dict(model)
+    name = config.pop("name")
+    try:
+        return MODELS[name](**config)
+    except KeyError:
+        raise ValueError(
+            "{} is not a valid model. Choose from {}.".format(name, list(MODELS))
+        )
+
+
+def _fit_chunk(values, years, configs):
+    # process pool worker: fits every model on a block of series.
+    matrix = SeriesMatrix(values, None, years)
+    return [get_model(config).fit(matrix) for config in configs]
+
+
+def fit_models(matrix, models=None, workers=1):
+    """Fits forecasting models on every series of a SeriesMatrix.
+
+    Parameters
+    -----------
+    matrix: SeriesMatrix
+
+    models: list[str, dict or ForecastModel] (optional)
+        Models to fit, e.g. ['linear_trend', {'name': 'ar', 'p': 3}]. Defaults to
+        every model in MODELS with its default settings.
+
+    workers: int
+        Number of processes. Above 1 the series are split in blocks fitted in a
+        process pool; each block is still fitted with batched linear algebra.
+
+    Returns
+    --------
+    params: dict[str, dict[str, numpy.ndarray]]
+        Fitted parameters per model name, one row per series.
+
+    report: pandas.DataFrame
+        Wall-clock seconds and throughput (series per second) per model.
+    """
+    models = [get_model(i) for i in (models or list(MODELS))]
+    params, rows = {}, []
+
+    if workers > 1:
+        blocks = np.array_split(np.arange(len(matrix)), workers)
+        configs = [i.config() for i in models]
+        start = time.perf_counter()
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(
+                pool.map(
+                    _fit_chunk,
+                    [matrix.values[i] for i in blocks],
+                    [matrix.years] * len(blocks),
+                    [configs] * len(blocks),
+                )
+            )
+        seconds = time.perf_counter() - start
+        for j, model in enumerate(models):
+            params[model.name] = {
+                k: np.concatenate([r[j][k] for r in results]) for k in results[0][j]
+            }
+        rows.append({"model": "all", "series": len(matrix), "seconds": seconds})
+    else:
+        for model in models:
+            start = time.perf_counter()
+            params[model.name] = model.fit(matrix)
+            seconds = time.perf_counter() - start
+            rows.append({"model": model.name, "series": len(matrix), "seconds": seconds})
+
+    report = pd.DataFrame(rows)
+    report["series_per_sec"] = report["series"] / report["seconds"]
+    return params, report
+
+
+def model_version(df, models):
+    """Short digest of the training data and model settings."""
+    configs = [get_model(i).config() for i in models]
+    digest = hashlib.sha256(
+        json.dumps([frame_fingerprint(df), configs], sort_keys=True).encode()
+    )
+    return digest.hexdigest()[:12]
+
+
+def current_version(directory):
+    """Returns the version saved models in directory currently point to, or None."""
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def save_models(matrix, models, params, directory, version=None, keep=3):
+    """Writes fitted parameters as one .npy file per parameter (so they can be
+    memory-mapped by src.models.predict_model) plus a meta.json with the series
+    keys, years, model settings and version.
+
+    Every version is written to its own directory, moved into place with an atomic
+    rename, and then made current by atomically replacing the CURRENT file. Files
+    of a saved version are never rewritten, so Predictors mapping an older version
+    keep reading consistent parameters until they reload.
+
+    Layout: directory/CURRENT, directory/<version>/meta.json,
+    directory/<version>/<model name>/<param>.npy
+
+    Parameters
+    -----------
+    version: str (optional)
+        Version name (see model_version). Defaults to a random one.
+
+    keep: int
+        Older versions kept besides the current one. Removed versions stay
+        readable by processes that still map them (POSIX).
+
+    Returns
+    --------
+    str
+        Directory of the saved version.
+    """
+    models = [get_model(i) for i in models]
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, version)
+
+    if not os.path.exists(path):
+        tmp = os.path.join(directory, ".tmp-{}".format(uuid.uuid4().hex))
+        for model in models:
+            os.makedirs(os.path.join(tmp, model.name))
+            for k, v in params[model.name].items():
+                np.save(os.path.join(tmp, model.name, "{}.npy".format(k)), v)
+        meta = {
+            "version": version,
+            "series_fields": matrix.keys.columns.tolist(),
+            "keys": matrix.keys.values.tolist(),
+            "years": matrix.years.tolist(),
+            "models": [i.config() for i in models],
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # the same version (same data and settings) was saved concurrently.
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    pointer = os.path.join(directory, ".CURRENT-{}".format(uuid.uuid4().hex))
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(directory, "CURRENT"))
+
+    # prunes the oldest versions.
+    versions = [
+        os.path.join(directory, i)
+        for i in os.listdir(directory)
+        if not i.startswith(".") and i != version
+    ]
+    versions = sorted(filter(os.path.isdir, versions), key=os.path.getmtime)
+    for old in versions[: max(len(versions) - keep, 0)]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def train(df, models=None, workers=1, directory=None, **kwargs):
+    """Builds the series matrix, fits the models and optionally saves them.
+
+    Parameters
+    -----------
+    df: pandas DataFrame
+        Long data as in data/processed.
+
+    models: list (optional)
+        See fit_models.
+
+    workers: int
+        See fit_models.
+
+    directory: str (optional)
+        Where to save the fitted parameters (see save_models).
+
+    kwargs: dict
+        Passed to SeriesMatrix.from_frame (series_fields, time_field, value_field).
+
+    Returns
+    --------
+    matrix: SeriesMatrix
+    params: dict[str, dict[str, numpy.ndarray]]
+    report: pandas.DataFrame
+    """
+    models = [get_model(i) for i in (models or list(MODELS))]
+    matrix = SeriesMatrix.from_frame(df, **kwargs)
+    params, report = fit_models(matrix, models, workers=workers)
+    if directory is not None:
+        save_models(matrix, models, params, directory, model_version(df, models))
+    return matrix, params, report
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 120)
+    for name in DATASETS:
+        df = load_dataset(name)
+        directory = os.path.join(MODELS_DIR, name.lower().replace(" ", "_"))
+        print("Training {} -> {}".format(name, directory))
+        matrix, params, report = train(df, directory=directory)
+        print(report.round(4))
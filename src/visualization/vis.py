@@ -3,10 +3,6 @@ import sys
 ROOT_DIR = os.path.dirname(os.path.abspath('..'))
 sys.path.insert(0, os.path.abspath(ROOT_DIR))
 
-import pandas as pd
-import plotly.express as px
-import streamlit as st
-
 
 def query_prod_growth(countries, subject):
     country_query = " | ".join([f"(Country == '{i}')" for i in countries])
@@ -17,6 +13,8 @@ def query_prod_growth(countries, subject):
 def prod_growth_plot(
     df, countries, subject, kind="line", color="Country", activity=None, trendline=None
 ):
+    import plotly.express as px
+
     user_query = query_prod_growth(countries=countries, subject=subject)
     df = df.query(user_query)
 